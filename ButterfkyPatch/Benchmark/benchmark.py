@@ -0,0 +1,111 @@
+"""
+Time each hot path of the Butterfly patch on synthetic scans of several sizes, without Slicer.
+
+    python Benchmark/benchmark.py --sizes 50000 200000 1000000 2000000 --output benchmark.json
+
+The json keeps one record per (size, stage) with every repeat, to follow the scaling curves across releases.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import numpy as np
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import SyntheticScan
+from Method import util, orientation
+from Method.util import vtkMeanTeeth
+from Method.orientation import GetOrientation
+from Method.make_butterfly import butterflyPatch, ButterflyParameter, ButterflyLandmark, ButterflyCurve
+from Method.propagation import Dilation
+from Method.session import PatchSession
+from Method.draw import drawPatch
+from Method.backend import getBackend
+
+SIZES = [50000,200000,500000,1000000,2000000]
+
+
+def ClearCache():
+    util._tooth_index_cache.clear()
+    orientation._orientation_cache.clear()
+
+
+def Timeit(function,repeat,setup=None):
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def BenchmarkSize(size,repeat,backend):
+    surf , info = SyntheticScan(size)
+    parameter = ButterflyParameter()
+
+    def Session():
+        ClearCache()
+        return PatchSession(surf,backend=backend)
+
+    # warm session to time each stage alone
+    session = Session()
+    landmark = ButterflyLandmark(session.orientation.centroid(parameter.teeth()),parameter)
+    start , end, _ = ButterflyCurve(landmark).segments()
+    arg_border = session.index_oriented.querySegment(start,end,session.radius)
+    V_label = np.zeros(len(session.vertices),dtype=np.uint8)
+    V_label[arg_border] = 1
+    middle_arg = np.argmin(np.sum(np.square(session.orientation.vertices[:,:2] - landmark['middle'][:2]),axis=1))
+    session.adjacency
+
+    stages = {}
+    stages['vtkMeanTeeth'] = Timeit(lambda _ : vtkMeanTeeth(parameter.teeth(),property='Universal_ID')(surf),repeat,ClearCache)
+    stages['orientation'] = Timeit(lambda _ : GetOrientation(surf,session.target,session.landmarks),repeat,ClearCache)
+    stages['spatial_index'] = Timeit(lambda s : s.index_oriented,repeat,lambda : PatchSession(surf,backend=backend))
+    stages['band_queries'] = Timeit(lambda _ : session.index_oriented.querySegment(start,end,session.radius),repeat)
+    stages['adjacency'] = Timeit(lambda s : s.adjacency,repeat,lambda : PatchSession(surf,backend=backend))
+    stages['Dilation'] = Timeit(lambda _ : Dilation(middle_arg,None,V_label.copy(),adjacency=session.adjacency),repeat)
+    stages['session_update'] = Timeit(lambda _ : session.update(parameter),repeat)
+    stages['drawPatch'] = Timeit(lambda _ : drawPatch(list(info['outline']),surf,info['mid'],backend=backend),repeat)
+    stages['butterflyPatch'] = Timeit(lambda _ : butterflyPatch(surf,*parameter,backend=backend),repeat,ClearCache)
+
+    return [{'vertices' : surf.GetNumberOfPoints(),
+             'stage' : stage,
+             'times' : times,
+             'min' : min(times),
+             'median' : float(np.median(times))} for stage, times in stages.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Butterfly patch on synthetic scans')
+    parser.add_argument('--sizes',type=int,nargs='+',default=SIZES,help='number of vertices of the scans')
+    parser.add_argument('--repeat',type=int,default=3)
+    parser.add_argument('--backend',default=None,help='numpy, torch or cuda, see Method.backend')
+    parser.add_argument('--output',default='benchmark.json')
+    args = parser.parse_args(argv)
+
+    backend = getBackend(args.backend)
+    results = []
+    for size in args.sizes:
+        records = BenchmarkSize(size,args.repeat,backend)
+        for record in records:
+            print(f"{record['vertices']:>9} {record['stage']:<16} {record['median']:.4f} s")
+        results += records
+
+    output = {'date' : datetime.datetime.now().isoformat(),
+              'python' : platform.python_version(),
+              'numpy' : np.__version__,
+              'platform' : platform.platform(),
+              'backend' : backend.name,
+              'repeat' : args.repeat,
+              'results' : results}
+    with open(args.output,'w') as file:
+        json.dump(output,file,indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import numpy as np
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+from Method.transformation import RotationMatrix
+
+
+def SyntheticScan(number_vertex,seed=0):
+    """
+    Return a synthetic upper intraoral scan with about number_vertex vertices: a palate dome
+    with the 16 upper teeth (Universal_ID 1 to 16) as bumps along the arch, randomly rotated and translated.
+
+    Returns
+    -------
+    vtk.vtkPolyData
+        Scan with the point array Universal_ID (0 for the gum)
+    dict
+        'outline' a closed curve on the palate (nb_point, 3) and 'mid' a point inside it, for drawPatch
+    """
+    rng = np.random.default_rng(seed)
+    n = max(int(np.sqrt(number_vertex)),10)
+
+    x , y = np.meshgrid(np.linspace(-30,30,n),np.linspace(-30,30,n),indexing='ij')
+    x , y = x.ravel(), y.ravel()
+    z = -0.01 * (np.square(x) + np.square(y))
+
+    labels = np.zeros(n*n,dtype=np.int64)
+    arch = np.linspace(-20,20,16)
+    for tooth , xt in enumerate(arch):
+        yt = 15 - 0.05 * np.square(xt)
+        dist = np.square(x - xt) + np.square(y - yt)
+        crown = dist < 4
+        labels[crown] = tooth + 1
+        z[crown] += 3 - 0.5 * dist[crown]
+    points = np.stack([x,y,z],axis=1)
+
+    grid = np.arange(n*n).reshape(n,n)
+    a , b = grid[:-1,:-1].ravel(), grid[1:,:-1].ravel()
+    c , d = grid[:-1,1:].ravel(), grid[1:,1:].ravel()
+    faces = np.concatenate([np.stack([a,b,c],axis=1),np.stack([b,d,c],axis=1)])
+
+    angle = np.linspace(0,2*np.pi,60,endpoint=False)
+    outline = np.stack([8*np.cos(angle),3+6*np.sin(angle)],axis=1)
+    outline = np.concatenate([outline,-0.01*np.sum(np.square(outline),axis=1,keepdims=True)],axis=1)
+    mid = np.array([0,3,-0.09])
+
+    matrix = RotationMatrix(rng.normal(size=3),rng.uniform(-0.3,0.3))
+    translation = rng.uniform(-10,10,3)
+    points , outline, mid = [p @ matrix.T + translation for p in (points,outline,mid)]
+
+    surf = vtk.vtkPolyData()
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(points.astype(np.float32),deep=True))
+    surf.SetPoints(vtk_points)
+
+    offsets = np.arange(0,3 * len(faces) + 1,3,dtype=np.int64)
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_to_vtkIdTypeArray(offsets,deep=True),numpy_to_vtkIdTypeArray(faces.astype(np.int64).ravel(),deep=True))
+    surf.SetPolys(polys)
+
+    vtk_labels = numpy_to_vtk(labels,deep=True)
+    vtk_labels.SetName('Universal_ID')
+    surf.GetPointData().AddArray(vtk_labels)
+
+    return surf , {'outline' : outline.astype(np.float32), 'mid' : mid}
@@ -0,0 +1,108 @@
+"""
+Check on synthetic scans that the fast paths give the labels of the reference computations.
+
+    python -m pytest Benchmark
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import SyntheticScan
+from Method.make_butterfly import ButterflyParameter
+from Method.session import PatchSession
+from Method.sweep import ParameterSweep
+from Method.orientation import OrientationMatrix, OrientationMatrices
+
+PARAMETERS = [ButterflyParameter(),
+              ButterflyParameter(5,12,3,14,0.2,0.4,0.25,0.4,0,0,0,0),
+              ButterflyParameter(6,11,4,13,0.3,0.3,0.33,0.33,1,-1,0.5,0)]
+
+
+def ReferenceDilation(arg_point,F,texture):
+    """
+    Numpy port of the first Dilation: the neighbours of the frontier are the vertices of the faces
+    touching it, the ones not labeled yet are the next frontier
+    """
+    texture = np.array(texture)
+
+    def Neighbours(arg_point):
+        return np.unique(F[np.any(np.isin(F,arg_point),axis=1)])
+
+    frontier = np.setdiff1d(Neighbours([arg_point]),np.flatnonzero(texture == 1))
+    while len(frontier) != 0 :
+        texture[frontier] = 1
+        frontier = np.setdiff1d(Neighbours(frontier),np.flatnonzero(texture == 1))
+    return texture
+
+
+@pytest.fixture(scope='module')
+def session():
+    surf , _ = SyntheticScan(20000,seed=1)
+    return PatchSession(surf,proxy_size=5000)
+
+
+@pytest.mark.parametrize('parameter',PARAMETERS)
+def test_fill_reference(session,parameter):
+    landmark , curves = session.butterflyCurve(parameter)
+    arg_border = session.butterflyBand(curves)
+    arg_seed = session.butterflySeed(landmark)
+    V_label = np.zeros(len(session.vertices),dtype=np.uint8)
+    V_label[arg_border] = 1
+
+    reference = ReferenceDilation(arg_seed,session.faces,V_label)
+    assert np.array_equal(session.fill(arg_border,arg_seed),reference)
+    assert np.array_equal(session.compute(parameter),reference)
+
+
+def test_sweep_compute(session):
+    V_label = ParameterSweep(session).labels(PARAMETERS,chunk=2)
+    for label , parameter in zip(V_label,PARAMETERS):
+        assert np.array_equal(label,session.compute(parameter,mode='inside',band=True))
+
+
+@pytest.mark.parametrize('parameter',PARAMETERS)
+def test_proxy_full(session,parameter):
+    assert len(session.proxy.session.vertices) < len(session.vertices)
+    full = session.compute(parameter,mode='inside',band=True)
+    assert np.array_equal(session.compute(parameter,mode='inside',band=True,proxy=True),full)
+
+
+def test_orientation_matrices():
+    sessions = [PatchSession(SyntheticScan(5000,seed=seed)[0]) for seed in range(20)]
+    matrices = OrientationMatrices([session.tooth_index for session in sessions],PatchSession.target,PatchSession.landmarks)
+    reference = np.stack([OrientationMatrix(session.surf,PatchSession.target,PatchSession.landmarks) for session in sessions])
+    # the closed form alignment and the reference only differ by rounding, about 1e-5
+    assert np.allclose(matrices,reference,rtol=0,atol=1e-4)
+
+
+def GridOutline(vertices,low,high):
+    """
+    Closed outline going through the vertices of the border of the square [low, high] of the grid of SyntheticScan,
+    and the vertex at its center
+    """
+    grid = vertices.reshape(int(np.sqrt(len(vertices))),-1,3)
+    ring = [(low,j) for j in range(low,high)] + [(i,high) for i in range(low,high)]
+    ring += [(high,j) for j in range(high,low,-1)] + [(i,low) for i in range(high,low,-1)]
+    return np.array([grid[i,j] for i, j in ring]), grid[(low + high) // 2,(low + high) // 2]
+
+
+def test_patches_dilation(session):
+    patches = [GridOutline(session.vertices,20,40),GridOutline(session.vertices,60,90),GridOutline(session.vertices,100,115)]
+    labels = [3,1,7]
+
+    reference = np.zeros(len(session.vertices),dtype=np.uint8)
+    for (outline , mid), label in zip(patches,labels):
+        reference[session.computeDraw(outline,mid) == 1] = label
+    assert len(np.unique(reference)) == len(patches) + 1
+    assert np.array_equal(session.computePatches(patches,labels=labels),reference)
+
+
+@pytest.mark.parametrize('labels',[[0,1],[-1,2]])
+def test_patches_labels(session,labels):
+    patches = [GridOutline(session.vertices,20,40),GridOutline(session.vertices,60,90)]
+    with pytest.raises(ValueError):
+        session.computePatches(patches,labels=labels)
@@ -1,7 +1,6 @@
 import logging
 import os
 from functools import partial
-from vtk.util.numpy_support import vtk_to_numpy
 import vtk
 # import sip
 
@@ -20,11 +19,11 @@ from qt import (QGridLayout,
                 QComboBox,
                 QPushButton,
                 QFileDialog,
+                QTimer,
                 QWidget)
 
 
-from Method.make_butterfly import butterflyPatch
-from Method import ComputeNormals, drawPatch
+# Method (numpy and the vtk numpy bridge) is imported by the methods using it, on the first computation
 #
 # ButterfkyPatch
 #
@@ -166,6 +165,10 @@ class ButterfkyPatchWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.list_widget_scan = []
         self.manageNumberWidgetScan(2)
 
+        self.button_update_all = QPushButton('Update all scans')
+        self.button_update_all.pressed.connect(self.updateAllScans)
+        self.layout.addWidget(self.button_update_all)
+
 
     def manageNumberWidgetScan(self,number):
         print(f'manage number widget scan, number : {number}')
@@ -179,7 +182,10 @@ class ButterfkyPatchWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
 
     def removeWidgetScan(self):
-        mainwidgetscan = self.list_widget_scan.pop(-1).getMainWidget()
+        widget_scan = self.list_widget_scan.pop(-1)
+        # the timer of a running task must not reach the widgets once they are deleted
+        widget_scan.cancelTask()
+        mainwidgetscan = widget_scan.getMainWidget()
         mainwidgetscan.deleteLater()
         mainwidgetscan = None
 
@@ -187,12 +193,28 @@ class ButterfkyPatchWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.list_widget_scan.append(WidgetParameter(self.ui.verticalLayout_2,self.parent))
 
 
+    def updateAllScans(self):
+        from Method.task import GetPool
+
+        # every loaded scan is computed on the same bounded pool, each panel applies its result when it is ready
+        pool = GetPool()
+        for widget_scan in self.list_widget_scan:
+            if widget_scan.surf is not None :
+                # a panel with an invalid parameter does not stop the other scans
+                try :
+                    widget_scan.processPatch(executor=pool)
+                except ValueError as error:
+                    widget_scan.label_status.setText(f'Error {error}')
+
+
 
 
     def cleanup(self):
         """
         Called when the application closes and the module widget is destroyed.
         """
+        for widget_scan in self.list_widget_scan:
+            widget_scan.cancelTask()
         self.removeObservers()
 
     def enter(self):
@@ -447,6 +469,10 @@ class WidgetParameter:
         self.parent_layout = layout
         self.parent = parent
         self.surf = None
+        self.path = None
+        self.session = None
+        self.task = None
+        self.task_session = None
         self.main_widget = QWidget()
         layout.addWidget(self.main_widget)
         self.maint_layout = QVBoxLayout(self.main_widget)
@@ -542,6 +568,29 @@ class WidgetParameter:
         self.button_update.pressed.connect(self.processPatch)
         self.layout_button_display.addWidget(self.button_update)
 
+        self.button_cancel = QPushButton('Cancel')
+        self.button_cancel.pressed.connect(self.cancelTask)
+        self.button_cancel.setEnabled(False)
+        self.layout_button_display.addWidget(self.button_cancel)
+
+        # off by default, the labels are then written in the result store (BUTTERFLY_STORE or ~/.cache/butterfly/results)
+        self.checkbox_store = QCheckBox('Keep the results on disk')
+        self.checkbox_store.setChecked(False)
+        self.layout_button_display.addWidget(self.checkbox_store)
+
+        # off by default, the opened scans are then copied in the mesh cache (BUTTERFLY_CACHE or ~/.cache/butterfly)
+        self.checkbox_cache = QCheckBox('Cache the scan on disk')
+        self.checkbox_cache.setChecked(False)
+        self.layout_button_display.addWidget(self.checkbox_cache)
+
+        self.label_status = QLabel('')
+        layout.addWidget(self.label_status)
+
+        # the patch is computed in a thread, the timer reads its progress and applies the labels on the main thread
+        self.timer = QTimer()
+        self.timer.setInterval(100)
+        self.timer.timeout.connect(self.checkTask)
+
     def getMainWidget(self):
         return self.main_widget
     
@@ -580,13 +629,24 @@ class WidgetParameter:
 
     def viewScan(self):
         if self.surf == None :
-            self.surf = slicer.util.loadModel(self.lineedit.text)
+            self.path = self.lineedit.text
+            # loadModel keeps every point array and converts the file coordinates to RAS
+            self.surf = slicer.util.loadModel(self.path)
+
 
+    def getSession(self):
+        from Method.session import PatchSession
 
-    def processPatch(self):
-        modelNode = self.surf.GetPolyData()
-        butterflyPatch(modelNode,
-                        int(self.lineedit_teeth_left_top.text),
+        # the session keeps the orientation, adjacency and indices of the scan between the updates
+        if self.session is None or self.session.surf is not self.surf.GetPolyData():
+            self.session = PatchSession(self.surf.GetPolyData())
+        return self.session
+
+
+    def getParameter(self):
+        from Method.make_butterfly import ButterflyParameter
+
+        return ButterflyParameter(int(self.lineedit_teeth_left_top.text),
                        int(self.lineedit_teeth_right_top.text),
                        int(self.lineedit_teeth_left_bot.text),
                        int(self.lineedit_teeth_right_bot.text),
@@ -598,10 +658,98 @@ class WidgetParameter:
                        float(self.lineedit_adjust_right_top.text),
                        float(self.lineedit_adjust_left_bot.text),
                        float(self.lineedit_adjust_right_bot.text))
-        
 
-        modelNode.Modified()
+
+    def processPatch(self,executor=None):
+        from Method.store import GetStore
+
+        session = self.getSession()
+        parameter = self.getParameter()
+        if not self.checkbox_store.checked :
+            self.startTask(session,lambda progress : session.compute(parameter,progress=progress),executor=executor)
+            return
+        # the labels of a scan and parameters already computed are read from the result store
+        store = GetStore()
+        self.startTask(session,lambda progress : store.compute(session,parameter,progress=progress),executor=executor)
+
+
+    def startTask(self,session,function,executor=None):
+        from Method.task import PatchTask
+
+        # only the last request is applied, the previous one stops at its next progress call
+        self.cancelTask()
+        # the adjacency of the mesh cache is read or written in the task, not on the main thread
+        path = self.path if self.checkbox_cache.checked and 'adjacency' not in session.__dict__ else None
+
+        def run(progress):
+            if path is not None :
+                self.seedSession(session,path,progress)
+            return function(progress)
+
+        self.task = PatchTask(run,executor=executor)
+        self.task_session = session
+        self.label_status.setText('Computing')
+        self.button_cancel.setEnabled(True)
+        self.timer.start()
+
+
+    def seedSession(self,session,path,progress):
+        from Method.cache import SeedSession
+
+        # called in the task thread, the session gets the adjacency of the cache, the rest comes from the displayed model
+        try :
+            SeedSession(session,path)
+        except Exception as error:
+            logging.warning(f'The mesh cache is not used for {path}: {error}')
+        progress('cache')
+
+
+    def cancelTask(self):
+        if self.task is not None :
+            self.task.cancel()
+            self.task = None
+            self.label_status.setText('Cancelled')
+        self.button_cancel.setEnabled(False)
+        self.timer.stop()
+
+
+    def checkTask(self):
+        from Method.task import PatchCancelled
+        from Method.util import ToothNoExist
+
+        task = self.task
+        if task is None :
+            self.timer.stop()
+            return
+        messages = task.messages()
+        if len(messages) != 0 :
+            stage , value = messages[-1]
+            self.label_status.setText(f'{stage} {value}' if value is not None else stage)
+        if not task.done():
+            return
+
+        self.task = None
+        self.timer.stop()
+        self.button_cancel.setEnabled(False)
+        try :
+            V_label = task.result()
+        except PatchCancelled :
+            self.label_status.setText('Cancelled')
+            return
+        except ToothNoExist as error:
+            print(f' Error {error}')
+            self.label_status.setText(str(error))
+            return
+        except Exception as error:
+            # any other failure of the computation is reported, the timer is already stopped
+            logging.exception('Patch computation failed')
+            self.label_status.setText(f'Error {type(error).__name__}: {error}')
+            return
+
+        self.task_session.apply(V_label)
+        self.task_session.surf.Modified()
         self.displaySegmentation(self.surf)
+        self.label_status.setText('Done')
 
 
 
@@ -619,7 +767,7 @@ class WidgetParameter:
 
 
     def curvePoint(self):
-
+        from Method.util import ComputeNormals
 
         surf = self.surf.GetPolyData()
         surf_normal = ComputeNormals(surf)
@@ -643,10 +791,14 @@ class WidgetParameter:
 
 
     def draw(self):
-        modelNode = self.surf.GetPolyData()
-        drawPatch(list(vtk_to_numpy(self.curve.GetCurvePointsWorld().GetData())),modelNode,self.middle_point.GetNthControlPointPositionWorld(0))
-        modelNode.Modified()
-        self.displaySegmentation(self.surf)
+        from vtk.util.numpy_support import vtk_to_numpy
+
+        session = self.getSession()
+        # the markups are read on the main thread, the thread only gets numpy copies
+        # the band follows the curve points displayed by Slicer, whatever the curve type and the surface constraint
+        outlinePoints = vtk_to_numpy(self.curve.GetCurvePointsWorld().GetData()).copy()
+        mid = list(self.middle_point.GetNthControlPointPositionWorld(0))
+        self.startTask(session,lambda progress : session.computeDraw(outlinePoints,mid,progress=progress))
 
 
     def displaySurf(self,surf):
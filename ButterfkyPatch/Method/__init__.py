@@ -1,2 +1,35 @@
-from .util import ComputeNormals
-from .draw import drawPatch
\ No newline at end of file
+"""
+The submodules are imported on the first access to one of their names, import Method alone loads
+neither vtk nor numpy. Import the submodules directly (from Method.session import PatchSession)
+to load only what is needed.
+"""
+import importlib
+
+_lazy = {'ComputeNormals' : 'util',
+         'ToothNoExist' : 'util',
+         'drawPatch' : 'draw',
+         'butterflyPatch' : 'make_butterfly',
+         'ButterflyParameter' : 'make_butterfly',
+         'PatchSession' : 'session',
+         'PatchTask' : 'task',
+         'PatchCancelled' : 'task',
+         'GetPool' : 'task',
+         'LoadScan' : 'cache',
+         'ResultStore' : 'store',
+         'ParameterSweep' : 'sweep',
+         'ExportPool' : 'export',
+         'OrientSessions' : 'orientation'}
+
+__all__ = list(_lazy)
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_lazy[name]}',__name__),name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,145 @@
+import os
+import sys
+import logging
+import importlib.util
+import numpy as np
+
+BACKEND_ENV = 'BUTTERFLY_BACKEND'
+BACKEND_NAMES = ['numpy','torch','cuda']
+
+
+def toNumpy(array):
+    """
+    Return array as a np.array, torch tensors are moved to the cpu first
+    """
+    if hasattr(array,'detach'):
+        array = array.detach().cpu().numpy()
+    return np.asarray(array)
+
+
+
+class NumpyBackend:
+    """
+    Compute on the cpu with numpy, torch is never imported
+    """
+    name = 'numpy'
+
+    def asarray(self,array,dtype=None):
+        return np.asarray(toNumpy(array),dtype=dtype)
+
+    def numpy(self,array):
+        return toNumpy(array)
+
+    def zeros(self,size,dtype='float32'):
+        return np.zeros(size,dtype=dtype)
+
+    def arange(self,size,dtype='int64'):
+        return np.arange(size,dtype=dtype)
+
+    def concatenate(self,arrays):
+        return np.concatenate(arrays)
+
+    def repeat(self,array,repeats):
+        return np.repeat(array,repeats)
+
+    def cumsum(self,array):
+        return np.cumsum(array)
+
+    def unique(self,array):
+        return np.unique(array)
+
+
+
+class TorchBackend:
+    """
+    Compute with torch on the device (cpu or cuda)
+    """
+    def __init__(self,device='cpu') -> None:
+        import torch
+        self.torch = torch
+        self.device = torch.device(device)
+        self.name = 'cuda' if self.device.type == 'cuda' else 'torch'
+
+    def _dtype(self,dtype):
+        if dtype is None or isinstance(dtype,self.torch.dtype):
+            return dtype
+        return getattr(self.torch,np.dtype(dtype).name)
+
+    def asarray(self,array,dtype=None):
+        if not isinstance(array,self.torch.Tensor):
+            array = self.torch.as_tensor(np.asarray(array))
+        return array.to(device=self.device,dtype=self._dtype(dtype))
+
+    def numpy(self,array):
+        return toNumpy(array)
+
+    def zeros(self,size,dtype='float32'):
+        return self.torch.zeros(size,dtype=self._dtype(dtype),device=self.device)
+
+    def arange(self,size,dtype='int64'):
+        return self.torch.arange(size,dtype=self._dtype(dtype),device=self.device)
+
+    def concatenate(self,arrays):
+        return self.torch.cat(arrays)
+
+    def repeat(self,array,repeats):
+        return self.torch.repeat_interleave(array,repeats)
+
+    def cumsum(self,array):
+        return self.torch.cumsum(array,0)
+
+    def unique(self,array):
+        return self.torch.unique(array)
+
+
+
+_backends = {}
+
+
+def torchAvailable():
+    return importlib.util.find_spec('torch') is not None
+
+
+def cudaAvailable():
+    if not torchAvailable():
+        return False
+    import torch
+    return torch.cuda.is_available()
+
+
+def getBackend(backend=None):
+    """
+    Return the compute backend shared by the Method modules.
+
+    Parameters
+    ----------
+    backend : str or backend, optional
+        'numpy', 'torch' (torch on cpu) or 'cuda'. When None, the environment variable
+        BUTTERFLY_BACKEND is used. Without it, cuda is chosen if torch is already imported and sees a GPU,
+        numpy otherwise: torch takes seconds to import and is not imported only to look for a GPU.
+        A backend that is not available falls back to cuda -> torch -> numpy.
+
+    Returns
+    -------
+    NumpyBackend or TorchBackend
+    """
+    if backend is not None and not isinstance(backend,str):
+        return backend
+
+    name = backend or os.environ.get(BACKEND_ENV,'')
+    name = name.strip().lower()
+    if name in ('','auto'):
+        name = 'cuda' if 'torch' in sys.modules and cudaAvailable() else 'numpy'
+    if name not in BACKEND_NAMES:
+        raise ValueError(f'Unknown backend {name}, choose between {BACKEND_NAMES}')
+
+    if name == 'cuda' and not cudaAvailable():
+        logging.warning('cuda is not available, fall back on the cpu')
+        name = 'torch'
+    if name == 'torch' and not torchAvailable():
+        logging.warning('torch is not installed, fall back on numpy')
+        name = 'numpy'
+
+    if name not in _backends:
+        _backends[name] = NumpyBackend() if name == 'numpy' else TorchBackend(name if name == 'cuda' else 'cpu')
+    return _backends[name]
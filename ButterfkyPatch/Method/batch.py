@@ -0,0 +1,194 @@
+"""
+Compute the Butterfly patch of many scans without Slicer, in a pool of worker processes.
+
+    python -m Method.batch scans/ 'T2/*.vtk' --parameter parameter.json --output out/ --workers 8
+
+With --trace, the stage timings of every scan are written as json lines (see Method.trace).
+With --cache, the scans are opened through the mesh cache (see Method.cache): a scan already processed is
+memory-mapped with its adjacency and tooth index instead of being read with VTK. The cache only keeps the points,
+the faces and the teeth labels, the other arrays of the scans are not in the written scans.
+With --compression, each worker writes its labeled scans as compressed .vtp files (see Method.export.WriteCompressed),
+the writes of a worker overlap with the computation of the other workers. With --label-only, the scans are not
+written again: the workers send the labels back and the main process writes them through an ExportPool while
+the workers compute the next scans.
+
+The parameter file is a json object with the fields of Method.make_butterfly.ButterflyParameter,
+the missing fields take the default values of the widget.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+EXTENSIONS = ['.vtk','.vtp','.stl']
+THREAD_ENV = ['OMP_NUM_THREADS','MKL_NUM_THREADS','OPENBLAS_NUM_THREADS']
+
+
+def ListScan(inputs):
+    """
+    Return the sorted scans of inputs, each input is a scan, a directory or a glob pattern
+    """
+    scans = set()
+    for path in inputs:
+        if os.path.isdir(path):
+            files = [os.path.join(path,name) for name in os.listdir(path)]
+        else :
+            files = glob.glob(path)
+        scans.update(os.path.abspath(file) for file in files if os.path.splitext(file)[1].lower() in EXTENSIONS)
+    return sorted(scans)
+
+
+def ReadParameter(path):
+    from Method.make_butterfly import ButterflyParameter
+
+    if path is None :
+        return ButterflyParameter()
+    with open(path) as file:
+        parameter = json.load(file)
+    unknown = set(parameter) - set(ButterflyParameter._fields)
+    if unknown :
+        raise ValueError(f'Unknown parameters {sorted(unknown)} in {path}')
+    return ButterflyParameter(**parameter)
+
+
+def OutputPath(scan,output,extension=None):
+    name , scan_extension = os.path.splitext(os.path.basename(scan))
+    if extension is None :
+        extension = scan_extension
+    # stl can not store point data
+    if extension.lower() == '.stl':
+        extension = '.vtk'
+    return os.path.join(output,f'{name}_Butterfly{extension}')
+
+
+def InitWorker(threads):
+    for env in THREAD_ENV:
+        os.environ[env] = str(threads)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+
+def ProcessScan(scan,output,parameter,backend,mode='fill',trace=False,proxy=None,store=None,compression=None,label_only=False,cache=None,tolerance=None):
+    """
+    Compute the labels of scan and write the labeled scan in output, return the scan, the output path, the error,
+    the trace records and, with label_only, the labels to write instead of the scan.
+    Any error of the scan is returned, one bad scan does not stop the batch.
+    """
+    from Method.util import ReadSurf, WriteSurf, ToothNoExist, NoSegmentationSurf
+    from Method.session import PatchSession
+    from Method.trace import Tracer, TraceStage
+
+    with Tracer() if trace else contextlib.nullcontext() as tracer:
+        try :
+            if cache is not None :
+                from Method.cache import LoadScan, MeshCache
+                session = LoadScan(scan,cache=MeshCache(cache),backend=backend)
+                surf = session.surf
+            else :
+                with TraceStage('read'):
+                    surf = ReadSurf(scan)
+                session = PatchSession(surf,backend=backend)
+            if proxy :
+                session.proxy_size = proxy
+            if store is not None :
+                from Method.store import ResultStore
+                V_label = ResultStore(store).compute(session,parameter,mode=mode,proxy=bool(proxy),tolerance=tolerance)
+                session.apply(V_label)
+            else :
+                V_label = session.update(parameter,mode=mode,proxy=bool(proxy),tolerance=tolerance)
+            if label_only :
+                from Method.export import LABEL_EXTENSION
+                return scan, OutputPath(scan,output,LABEL_EXTENSION), None, tracer and tracer.records, V_label
+            with TraceStage('write'):
+                if compression is None :
+                    path = OutputPath(scan,output)
+                    WriteSurf(surf,path)
+                else :
+                    from Method.export import WriteCompressed
+                    path = OutputPath(scan,output,'.vtp')
+                    WriteCompressed(surf,path,compression)
+        except (ToothNoExist,NoSegmentationSurf) as error:
+            return scan, None, str(error), tracer and tracer.records, None
+        except Exception as error:
+            return scan, None, f'{type(error).__name__}: {error}', tracer and tracer.records, None
+    return scan, path, None, tracer and tracer.records, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute the Butterfly patch of scans without Slicer')
+    parser.add_argument('input',nargs='+',help='scans (.vtk, .vtp, .stl), directories or glob patterns')
+    parser.add_argument('--parameter',help='json file with the ButterflyParameter fields')
+    parser.add_argument('--output',required=True,help='directory of the labeled scans')
+    parser.add_argument('--workers',type=int,default=os.cpu_count(),help='number of worker processes')
+    parser.add_argument('--threads',type=int,default=None,help='threads per worker, by default the cores are split between the workers')
+    parser.add_argument('--backend',default=None,help='numpy, torch or cuda, see Method.backend')
+    parser.add_argument('--mode',default='fill',choices=['fill','inside'],help='flood fill the band or point in polygon, see PatchSession.compute')
+    parser.add_argument('--trace',default=None,help='json lines file of the stage timings of every scan')
+    parser.add_argument('--proxy',type=int,default=None,help='compute on a decimated proxy of this number of vertices, see PatchSession.computeProxy')
+    parser.add_argument('--tolerance',type=float,default=None,help='with --proxy, distance to the outline where the labels are computed exactly, at least the band radius')
+    parser.add_argument('--store',default=None,help='directory of the result store, the labels already computed are read from it, see Method.store')
+    parser.add_argument('--compression',default=None,choices=['zlib','lz4','lzma','none'],help='write compressed .vtp files, see Method.export')
+    parser.add_argument('--label-only',action='store_true',help='write only the Butterfly array of each scan (.bfly), see Method.export.WriteLabel')
+    parser.add_argument('--cache',default=None,help='directory of the mesh cache, the scans already opened are memory-mapped, see Method.cache')
+    args = parser.parse_args(argv)
+    if args.label_only and args.compression is not None :
+        parser.error('--compression has no effect with --label-only, the labels are written without the scan')
+    if args.tolerance is not None and args.proxy is None :
+        parser.error('--tolerance is the refinement distance of --proxy')
+
+    scans = ListScan(args.input)
+    parameter = ReadParameter(args.parameter)
+    os.makedirs(args.output,exist_ok=True)
+    workers = max(1,min(args.workers,len(scans)))
+    threads = args.threads or max(1,os.cpu_count() // workers)
+
+    # the environment is inherited by the workers before they import numpy or torch
+    for env in THREAD_ENV:
+        os.environ[env] = str(threads)
+
+    failed = 0
+    writes = {}
+    trace = open(args.trace,'w') if args.trace else contextlib.nullcontext()
+    context = multiprocessing.get_context('spawn')
+    export = None
+    if args.label_only :
+        from Method.export import ExportPool
+        export = ExportPool()
+    try :
+        with trace, ProcessPoolExecutor(workers,mp_context=context,initializer=InitWorker,initargs=(threads,)) as executor:
+            futures = {executor.submit(ProcessScan,scan,args.output,parameter,args.backend,args.mode,args.trace is not None,
+                                       args.proxy,args.store,args.compression,args.label_only,args.cache,args.tolerance) : scan for scan in scans}
+            for future in as_completed(futures):
+                try :
+                    scan , path, error, records, V_label = future.result()
+                except Exception as exception :
+                    # the worker itself failed, for example killed
+                    scan , path, error, records, V_label = futures[future], None, f'{type(exception).__name__}: {exception}', None, None
+                if error is None :
+                    if V_label is not None :
+                        writes[export.submitLabel(V_label,path,source=os.path.basename(scan))] = scan
+                    print(f'{scan} -> {path}')
+                else :
+                    failed += 1
+                    print(f'{scan} Error {error}')
+                for record in records or []:
+                    trace.write(json.dumps(dict(scan=scan,**record)) + '\n')
+    finally :
+        if export is not None :
+            export.close()
+
+    for write, scan in writes.items():
+        if write.exception() is not None :
+            failed += 1
+            print(f'{scan} Error {write.exception()}')
+
+    print(f'{len(scans) - failed}/{len(scans)} scans done')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+On-disk cache of the scans. A cache file keeps the points, the faces, the teeth labels, the CSR adjacency
+and the tooth index of a scan as contiguous 64 bytes aligned blocks, it is memory-mapped when the scan is
+opened again so nothing is read before it is used:
+
+    session = LoadScan('P1_T1_IOS_U.vtk')
+
+The key of a file is the sha256 of the source file, a modified scan never reuses a stale entry.
+"""
+import os
+import json
+import logging
+import hashlib
+import tempfile
+import numpy as np
+from vtkmodules.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkCellArray
+
+from Method.util import ReadSurf, ToothIndex, SetToothIndex, NoSegmentationSurf, LabelProperty
+from Method.propagation import VertexAdjacency
+from Method.session import PatchSession
+from Method.trace import TraceStage
+
+CACHE_ENV = 'BUTTERFLY_CACHE'
+MAGIC = b'BFLYMESH'
+VERSION = 1
+ALIGNMENT = 64
+
+
+
+
+def UmaskMode():
+    """
+    Mode of a file created by open(): 0666 without the bits of the umask. The files written through
+    tempfile.mkstemp are 0600, they are given this mode before being renamed.
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# read once, os.umask is process wide and not thread safe
+FILE_MODE = UmaskMode()
+
+
+
+
+def FileHash(path,chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path,'rb') as file:
+        for block in iter(lambda : file.read(chunk),b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def Align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def WriteArrays(path,arrays,info=None):
+    """
+    Write a dict of arrays in the cache format: magic, version, size of the json header, json header
+    with the dtype, shape and offset of every array, then the aligned blocks.
+    The file is written next to path and renamed, a reader never sees a partial file.
+    """
+    arrays = {name : np.ascontiguousarray(array) for name, array in arrays.items()}
+    blocks = {}
+    offset = 0
+    for name, array in arrays.items():
+        blocks[name] = {'dtype' : array.dtype.str, 'shape' : list(array.shape), 'offset' : offset}
+        offset = Align(offset + array.nbytes)
+    header = json.dumps({'info' : info or {}, 'arrays' : blocks}).encode()
+    start = Align(len(MAGIC) + 8 + len(header))
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory,exist_ok=True)
+    file_descriptor , tmp = tempfile.mkstemp(dir=directory,suffix='.tmp')
+    try :
+        with os.fdopen(file_descriptor,'wb') as file:
+            file.write(MAGIC + np.array([VERSION,len(header)],dtype='<u4').tobytes() + header)
+            for name, array in arrays.items():
+                file.seek(start + blocks[name]['offset'])
+                file.write(array.tobytes())
+            file.truncate(start + offset)
+        os.chmod(tmp,FILE_MODE)
+        os.replace(tmp,path)
+    except BaseException :
+        os.remove(tmp)
+        raise
+
+
+def ReadArrays(path,mode='c'):
+    """
+    Return the info and the dict of arrays of a cache file, each array is a np.memmap of its block.
+    With mode 'c' the arrays are copy-on-write, they can be modified in memory without touching the file.
+    """
+    with open(path,'rb') as file:
+        magic = file.read(len(MAGIC))
+        version , size = np.frombuffer(file.read(8),dtype='<u4')
+        if magic != MAGIC or version != VERSION :
+            raise ValueError(f'{path} is not a cache file of version {VERSION}')
+        header = json.loads(file.read(size))
+    start = Align(len(MAGIC) + 8 + int(size))
+
+    arrays = {}
+    for name, block in header['arrays'].items():
+        shape = tuple(block['shape'])
+        if np.prod(shape) == 0 :
+            arrays[name] = np.zeros(shape,dtype=block['dtype'])
+        else :
+            arrays[name] = np.memmap(path,dtype=block['dtype'],mode=mode,offset=start + block['offset'],shape=shape)
+    return header['info'], arrays
+
+
+
+
+def MeshArrays(session):
+    """
+    Return the arrays of the cache entry of the scan of session, building its adjacency and tooth index
+    """
+    surf = session.surf
+    arrays = {'points' : session.vertices,
+              'faces' : session.faces,
+              'labels' : vtk_to_numpy(surf.GetPointData().GetScalars(session.property)),
+              'adjacency_offsets' : session.backend.numpy(session.adjacency.offsets),
+              'adjacency_indices' : session.backend.numpy(session.adjacency.indices)}
+    for name in ToothIndex.arrays :
+        arrays['tooth_' + name] = getattr(session.tooth_index,name)
+    return arrays
+
+
+def MeshFromArrays(arrays,property='Universal_ID'):
+    """
+    Return a vtkPolyData sharing the memory of the arrays of a cache entry
+    """
+    surf = vtkPolyData()
+    points = vtkPoints()
+    points.SetData(numpy_to_vtk(arrays['points']))
+    surf.SetPoints(points)
+
+    faces = arrays['faces']
+    offsets = np.arange(0,3 * len(faces) + 1,3,dtype=np.int64)
+    polys = vtkCellArray()
+    polys.SetData(numpy_to_vtkIdTypeArray(offsets),numpy_to_vtkIdTypeArray(np.asarray(faces,dtype=np.int64).reshape(-1)))
+    surf.SetPolys(polys)
+
+    labels = numpy_to_vtk(arrays['labels'])
+    labels.SetName(property)
+    surf.GetPointData().AddArray(labels)
+    surf.GetPointData().SetActiveScalars(property)
+    return surf
+
+
+
+
+class MeshCache:
+    """
+    Directory of cache files named after the sha256 of their source scan
+
+    Parameters
+    ----------
+    directory : str, optional
+        Folder of the cache, the BUTTERFLY_CACHE environment variable or ~/.cache/butterfly by default
+    """
+    def __init__(self,directory=None) -> None:
+        if directory is None:
+            directory = os.environ.get(CACHE_ENV,os.path.join(os.path.expanduser('~'),'.cache','butterfly'))
+        self.directory = directory
+
+    def path(self,key):
+        return os.path.join(self.directory,key[:2],key + '.bmesh')
+
+    def load(self,path,backend=None,property='Universal_ID'):
+        """
+        Return a PatchSession of the scan at path, read from the cache when it has an entry for the content
+        of the file, otherwise read with VTK and added to the cache
+
+        Raises
+        ------
+        NoSegmentationSurf
+            The scan has no label array property
+        """
+        key = FileHash(path)
+        cache_path = self.path(key)
+        if os.path.exists(cache_path):
+            with TraceStage('cache_read',path=path):
+                info , arrays = ReadArrays(cache_path)
+                if info.get('property') == property :
+                    return self.session(arrays,backend,info.get('label',property))
+
+        with TraceStage('cache_write',path=path):
+            surf = ReadSurf(path)
+            label = LabelProperty(surf,property)
+            if surf.GetPointData().GetScalars(label) is None :
+                raise NoSegmentationSurf(property)
+            session = PatchSession(surf,backend=backend,property=label)
+            # property is the name asked for, label the array of the scan used instead when it does not have it
+            try :
+                WriteArrays(cache_path,MeshArrays(session),info={'source' : os.path.basename(path),'property' : property,'label' : label})
+            except OSError as error:
+                # the scan is still usable, only the next opening is not faster
+                logging.warning(f'The mesh cache entry of {path} could not be written: {error}')
+        return session
+
+    def session(self,arrays,backend=None,property='Universal_ID'):
+        surf = MeshFromArrays(arrays,property)
+        session = PatchSession(surf,backend=backend,property=property)
+        # setting the cached properties skips their computation
+        session.vertices = np.asarray(arrays['points'],dtype=np.float32)
+        session.faces = arrays['faces']
+        session.adjacency = VertexAdjacency.fromCSR(arrays['adjacency_offsets'],arrays['adjacency_indices'],backend=session.backend)
+        session.tooth_index = ToothIndex.fromArrays({name : arrays['tooth_' + name] for name in ToothIndex.arrays})
+        SetToothIndex(surf,session.tooth_index,property)
+        return session
+
+
+
+
+def SeedSession(session,path,cache=None):
+    """
+    Give session the adjacency of the cache entry of the scan at path, read or written by LoadScan.
+    The topology does not depend on the coordinates, it is reused when surf of session is the scan loaded in
+    an other frame, for example a Slicer model node (RAS). Return True when the adjacency was reused.
+    """
+    cached = LoadScan(path,cache=cache,backend=session.backend,property=session.property)
+    if len(cached.vertices) != len(session.vertices) or not np.array_equal(cached.faces,session.faces):
+        return False
+    session.adjacency = cached.adjacency
+    return True
+
+
+def LoadScan(path,cache=None,backend=None,property='Universal_ID'):
+    """
+    Return a PatchSession of the scan at path through the mesh cache, see MeshCache.load
+    """
+    if cache is None:
+        cache = MeshCache()
+    return cache.load(path,backend=backend,property=property)
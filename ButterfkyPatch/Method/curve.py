@@ -0,0 +1,144 @@
+"""
+Curve primitives of the outlines. Every primitive is stored as a cubic Bezier curve: a segment, a quadratic
+Bezier (degree elevated) or a piece of closed Catmull-Rom spline, optionally mirrored across a line. The mirror
+is applied to the control points, a Bezier curve commutes with affine maps. All the curves of a batch are
+evaluated by one product of the Bernstein basis with the control points and returned as one contiguous buffer:
+
+    curves = CurveBatch()
+    curves.line(a, b)
+    curves.quadratic(p0, p1, p2, number=101, mirror=(p0, p2))
+    polyline = curves.evaluate()
+    start , end, arg_curve = polyline.segments()
+
+The control points of a call can be stacked (N, dim) to add N curves at once, see Method.sweep.
+"""
+import numpy as np
+
+from Method.spatial import RaggedRange
+
+
+
+
+def ReflectionMatrix(point1,point2):
+    """
+    Return the matrices (N, dim, dim) of the mirrors across the lines going through point1 and point2 (N, dim),
+    x is mirrored as point1 + (x - point1) @ R
+    """
+    v = point2 - point1
+    v = v / np.linalg.norm(v,axis=-1,keepdims=True)
+    return 2 * v[:,:,None] * v[:,None,:] - np.eye(v.shape[-1])
+
+
+def CatmullRom(points):
+    """
+    Return the cubic Bezier control points (nb_point, 4, dim) of the pieces of the closed uniform Catmull-Rom
+    spline going through points, the curve type of the Slicer curve markups
+    """
+    previous , following, after = np.roll(points,1,axis=0), np.roll(points,-1,axis=0), np.roll(points,-2,axis=0)
+    return np.stack([points,points + (following - previous) / 6,following - (after - points) / 6,following],axis=1)
+
+
+
+
+class Polyline:
+    """
+    Contiguous buffer of polylines, curve i is points[offsets[i]:offsets[i+1]]
+
+    Parameters
+    ----------
+    points : np.array
+        Points of all the curves (nb_point, dim)
+    offsets : np.array
+        Start of each curve in points and the total number of points (nb_curve + 1)
+    """
+    def __init__(self,points,offsets) -> None:
+        self.points = points
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self,i):
+        return self.points[self.offsets[i]:self.offsets[i+1]]
+
+    def segments(self):
+        """
+        Return the start and end (nb_segment, dim) of the segments of all the curves and the curve of each segment
+        """
+        count = np.maximum(np.diff(self.offsets) - 1,0)
+        arg_start = RaggedRange(self.offsets[:-1],count)
+        arg_curve = np.repeat(np.arange(len(self)),count)
+        return self.points[arg_start], self.points[arg_start + 1], arg_curve
+
+
+
+
+class CurveBatch:
+    """
+    Batch of curve primitives evaluated together, see the module docstring
+
+    Parameters
+    ----------
+    dim : int
+        Dimension of the points
+    """
+    def __init__(self,dim=2) -> None:
+        self.dim = dim
+        self.control = []
+        self.number = []
+
+    def cubic(self,point1,point2,point3,point4,number,mirror=None):
+        """
+        Add the cubic Bezier curves of control points point1 ... point4, (dim) or stacked (N, dim), each one
+        evaluated at number evenly spaced parameters. mirror is a pair of points of the mirror line.
+        """
+        control = np.stack(np.broadcast_arrays(*[np.asarray(point,dtype=np.float64).reshape(-1,self.dim)
+                                                  for point in (point1,point2,point3,point4)]),axis=1)
+        if mirror is not None :
+            origin , other = (np.asarray(point,dtype=np.float64).reshape(-1,self.dim) for point in mirror)
+            origin = np.broadcast_to(origin,(len(control),self.dim))
+            control = origin[:,None,:] + np.matmul(control - origin[:,None,:],ReflectionMatrix(origin,other))
+        self.control.append(control)
+        self.number.append(np.broadcast_to(np.asarray(number,dtype=np.int64),(len(control),)))
+        return self
+
+    def line(self,start,end,mirror=None):
+        start , end = np.asarray(start,dtype=np.float64), np.asarray(end,dtype=np.float64)
+        return self.cubic(start,start + (end - start) / 3,end + (start - end) / 3,end,2,mirror=mirror)
+
+    def quadratic(self,point1,point2,point3,number,mirror=None):
+        point1 , point2, point3 = (np.asarray(point,dtype=np.float64) for point in (point1,point2,point3))
+        return self.cubic(point1,point1 + 2 * (point2 - point1) / 3,point3 + 2 * (point2 - point3) / 3,point3,number,mirror=mirror)
+
+    def polygon(self,points):
+        """
+        Add the segments of the closed polygon going through points (nb_point, dim)
+        """
+        points = np.asarray(points,dtype=np.float64).reshape(-1,self.dim)
+        return self.line(points,np.roll(points,-1,axis=0))
+
+    def spline(self,points,step):
+        """
+        Add the pieces of the closed Catmull-Rom spline going through points (nb_point, dim), each piece is
+        evaluated with segments about step long
+        """
+        control = CatmullRom(np.asarray(points,dtype=np.float64).reshape(-1,self.dim))
+        length = np.linalg.norm(np.diff(control,axis=1),axis=2).sum(axis=1)
+        number = np.maximum(np.ceil(length / step),1).astype(np.int64) + 1
+        return self.cubic(*control.transpose(1,0,2),number)
+
+    def evaluate(self):
+        """
+        Return the Polyline of the curves in the order they were added
+        """
+        if not self.control :
+            return Polyline(np.zeros((0,self.dim)),np.zeros(1,dtype=np.int64))
+        control = np.concatenate(self.control)
+        number = np.concatenate(self.number)
+        offsets = np.concatenate([[0],np.cumsum(number)])
+
+        arg_curve = np.repeat(np.arange(len(control)),number)
+        t = (np.arange(offsets[-1]) - offsets[arg_curve]) / (number[arg_curve] - 1)
+        basis = np.stack([np.power(1 - t,3),3 * np.square(1 - t) * t,3 * (1 - t) * np.square(t),np.power(t,3)],axis=1)
+        points = np.einsum('ik,ikd->id',basis,control[arg_curve])
+        return Polyline(points,offsets)
@@ -0,0 +1,153 @@
+"""
+Export of the labeled scans. A scan is written as a XML PolyData file (.vtp) whose arrays are one appended
+binary block compressed by zlib, LZ4 or LZMA. The VTK writer holds the GIL, the writes of several scans only
+overlap in several processes (see Method.batch).
+
+When the source scan is kept, only the Butterfly array needs to be written: WriteLabel stores it next to the
+scan in the file format of Method.cache, as runs or a bit mask, a few kilobytes per scan (see Method.store).
+Those writes are plain file writes, a bounded pool of threads writes them while the next scans are computed:
+
+    with ExportPool() as export:
+        for session, path in scans:
+            export.submitLabel(session.update(parameter), path)
+
+The files get the mode of the umask, as files created by open().
+"""
+import os
+import tempfile
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from Method.cache import WriteArrays, ReadArrays, FILE_MODE
+from Method.store import EncodeLabel, DecodeLabel
+from Method.trace import TraceStage
+
+COMPRESSIONS = ['zlib','lz4','lzma','none']
+EXPORT_SIZE = min(4,os.cpu_count() or 1)
+LABEL_EXTENSION = '.bfly'
+
+
+
+
+def WriteCompressed(surf,path,compression='zlib',level=1):
+    """
+    Write surf as a .vtp file with the arrays appended as raw binary compressed by compression.
+    The file is written next to path and renamed, a reader never sees a partial file.
+
+    Parameters
+    ----------
+    compression : str
+        'zlib', 'lz4', 'lzma' or 'none'. On a scan, zlib gives the smallest files for its time, lz4 is
+        about 7 times faster for files about twice larger, lzma is much slower
+    level : int
+        Compression level from 1 (fastest) to 9 (smallest), the higher levels barely reduce a scan
+    """
+    from vtkmodules.vtkIOXML import vtkXMLPolyDataWriter
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression {compression}, use one of {COMPRESSIONS}')
+    writer = vtkXMLPolyDataWriter()
+    writer.SetInputData(surf)
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    {'zlib' : writer.SetCompressorTypeToZLib,
+     'lz4' : writer.SetCompressorTypeToLZ4,
+     'lzma' : writer.SetCompressorTypeToLZMA,
+     'none' : writer.SetCompressorTypeToNone}[compression]()
+    writer.SetCompressionLevel(level)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory,exist_ok=True)
+    file_descriptor , tmp = tempfile.mkstemp(dir=directory,suffix='.tmp')
+    os.close(file_descriptor)
+    try :
+        writer.SetFileName(tmp)
+        if not writer.Write():
+            raise OSError(f'Could not write {path}')
+        os.chmod(tmp,FILE_MODE)
+        os.replace(tmp,path)
+    except BaseException :
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def WriteLabel(V_label,path,source=None,name='Butterfly'):
+    """
+    Write the labels of a scan alone, source is the name of the scan they belong to
+    """
+    arrays , encoding = EncodeLabel(np.asarray(V_label))
+    WriteArrays(path,arrays,info={'encoding' : encoding,'size' : len(V_label),'name' : name,'source' : source})
+
+
+def ReadLabel(path):
+    """
+    Return the labels and the info of a file written by WriteLabel
+    """
+    info , arrays = ReadArrays(path,mode='r')
+    return DecodeLabel(arrays,info['encoding'],info['size']), info
+
+
+
+
+class ExportPool:
+    """
+    Bounded pool of label writer threads. submitLabel() keeps a copy of the labels and blocks while max_pending
+    writes are waiting so the labels held in memory are bounded. wait() raises the first error of the writes.
+
+    Parameters
+    ----------
+    workers : int
+        Number of writer threads
+    max_pending : int, optional
+        Number of writes submitted and not finished, twice the number of workers by default
+    """
+    def __init__(self,workers=EXPORT_SIZE,max_pending=None) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers,thread_name_prefix='PatchExport')
+        self._pending = threading.BoundedSemaphore(max_pending or 2 * workers)
+        self.futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        try :
+            self.wait()
+        finally :
+            self.close()
+
+    def close(self):
+        """
+        Finish the submitted writes and stop the threads, the errors are left in the futures
+        """
+        self.executor.shutdown(wait=True)
+
+    def _submit(self,function,*args):
+        self._pending.acquire()
+        try :
+            future = self.executor.submit(function,*args)
+        except BaseException :
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda future : self._pending.release())
+        self.futures.append(future)
+        return future
+
+    def submitLabel(self,V_label,path,source=None,name='Butterfly'):
+        """
+        Write the labels alone at path, see WriteLabel, return the future of the write
+        """
+        return self._submit(self._writeLabel,np.array(V_label),path,source,name)
+
+    def _writeLabel(self,V_label,path,source,name):
+        with TraceStage('export_label',path=path):
+            WriteLabel(V_label,path,source,name)
+        return path
+
+    def wait(self):
+        """
+        Wait for the submitted writes and return their paths
+        """
+        futures , self.futures = self.futures, []
+        return [future.result() for future in futures]
@@ -1,46 +1,98 @@
 import numpy as np
-import torch
-import vtk
-from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
-from Method.orientation import orientation
-from Method.util import vtkMeanTeeth, ToothNoExist
-from Method.propagation import Dilation
+from typing import NamedTuple
+from Method.util import ToothNoExist
+from Method.curve import CurveBatch
 
+STEP = 0.01
 
 
 
 
 
-class Segment2D :
-    def __init__(self,point1,point2,name_point1 =None , name_point2 = None) -> None:
-        self.point1 = np.array(point1)
-        self.point2 = np.array(point2)
-        self.a = point2[0] - point1[0]
-        self.b = point2[1] - point1[1]
 
-        self.x0 = point1[0]
-        self.y0 = point1[1] 
+class ButterflyParameter(NamedTuple):
+    """
+    The 12 parameters of the Butterfly patch, the defaults are the ones of the widget
+    """
+    tooth_anterior_right : int = 5
+    tooth_anterior_left : int = 12
+    tooth_posterior_right : int = 3
+    tooth_posterior_left : int = 14
+    ratio_anterior_right : float = 0.3
+    ratio_anterior_left : float = 0.3
+    ratio_posterior_left : float = 0.33
+    ratio_posterior_right : float = 0.33
+    adjust_anterior_right : float = 0
+    adjust_anterior_left : float = 0
+    adjust_posterior_right : float = 0
+    adjust_posterior_left : float = 0
 
-        self.name_point1 = name_point1
-        self.name_point2 = name_point2
+    def teeth(self):
+        return [self.tooth_anterior_right,self.tooth_anterior_left,self.tooth_posterior_right,self.tooth_posterior_left]
 
-        # print(f' a : {self.a}, b : {self.b}, x0 : {self.x0}, y0 : {self.y0}')
 
-    def __call__(self, t) :
-        x , y = self.x0 + self.a * t , self.y0 + self.b * t
 
-        return np.array([x ,y])
-    
+def ButterflyLandmark(centroid,parameter : ButterflyParameter):
+    """
+    Return the landmarks of the Butterfly outline from the oriented centroids of the teeth
+    """
+    p = parameter
+    centroid_anterior_right = centroid[str(p.tooth_anterior_right)] + np.array([0,p.adjust_anterior_right,0],dtype=np.float32)
+    centroid_anterior_left = centroid[str(p.tooth_anterior_left)] + np.array([0,p.adjust_anterior_left,0],dtype=np.float32)
 
-def Bezier_bled(point1,point2,point3,pas):
-    range = np.arange(0,1,pas)
-    matrix_t = np.array([np.square( 1 - range) , 2*(1 - range)*range, np.square(range)]).T
-    matrix_point = np.array([[point1],[point2],[point3]]).squeeze()
-    # print(f'shape matrix_t {matrix_t.shape}, matrix point {matrix_point.shape}')
-    return np.matmul(matrix_t,matrix_point)
 
+    centroid_posterior_rigth = centroid[str(p.tooth_posterior_right)] + np.array([0,p.adjust_posterior_right,0],dtype=np.float32)
+    centroid_posterior_left = centroid[str(p.tooth_posterior_left)]+ np.array([0,p.adjust_posterior_left ,0],dtype=np.float32)
 
 
+    landmark = {}
+    landmark['anterior_left'] = (1-p.ratio_anterior_left) * centroid_anterior_right + p.ratio_anterior_left * centroid_anterior_left
+    landmark['anterior_right'] = (1-p.ratio_anterior_right) * centroid_anterior_left + p.ratio_anterior_right * centroid_anterior_right
+
+    landmark['posterior_left'] = (1-p.ratio_posterior_left) * centroid_posterior_rigth + p.ratio_posterior_left * centroid_posterior_left
+    landmark['posterior_right'] = (1- p.ratio_posterior_right) * centroid_posterior_left + p.ratio_posterior_right * centroid_posterior_rigth
+    landmark['middle_posterior'] = (landmark['posterior_left'] + landmark['posterior_right']) / 2
+
+    landmark['middle'] = (landmark['posterior_left'] + landmark['anterior_right']) / 2
+    return landmark
+
+
+
+def ButterflyCurve(landmark):
+    """
+    Return the Polyline of the 2D curves of the Butterfly outline: the anterior and posterior segments
+    and the two mirrored Bezier curves. They share their ends, so the outline is closed.
+    The landmarks can be stacked (N, 3), then the curves are the N anterior segments, the N posterior
+    segments, and so on.
+    """
+    anterior_left = landmark['anterior_left'][...,:2]
+    anterior_right = landmark['anterior_right'][...,:2]
+    posterior_left = landmark['posterior_left'][...,:2]
+    posterior_right = landmark['posterior_right'][...,:2]
+    middle_posterior = landmark['middle_posterior'][...,:2]
+    number = int(round(1/STEP)) + 1
+
+    curves = CurveBatch(dim=2)
+    #rectangle limit
+    curves.line(anterior_left,anterior_right)
+    curves.line(posterior_left,posterior_right)
+    #bezier droite et gauche, mirrored across the line of their ends
+    curves.quadratic(posterior_right,middle_posterior,anterior_right,number,mirror=(posterior_right,anterior_right))
+    curves.quadratic(posterior_left,middle_posterior,anterior_left,number,mirror=(posterior_left,anterior_left))
+    return curves.evaluate()
+
+
+
+def ButterflyPolygon(curves):
+    """
+    Return the closed polygons (N, nb_vertex, 2) of the Butterfly outlines from the Polyline of ButterflyCurve,
+    going anterior left -> anterior right -> posterior right -> posterior left
+    """
+    number = len(curves) // 4
+    haut_seg , bas_seg, sym, sym2 = (curves.points[curves.offsets[i * number]:curves.offsets[(i + 1) * number]].reshape(number,-1,2)
+                                      for i in range(4))
+    return np.concatenate([haut_seg,sym[:,::-1][:,1:],bas_seg[:,::-1][:,1:],sym2[:,1:-1]],axis=1)
+
 
 
 
@@ -56,148 +108,27 @@ def butterflyPatch(surf,
         adjust_anterior_right,
         adjust_anterior_left,
         adjust_posterior_right,
-        adjust_posterior_left
+        adjust_posterior_left,
+        backend=None,
+        mode='fill'
          ):
-
-
-    surf_tmp = vtk.vtkPolyData()
-    surf_tmp.DeepCopy(surf)
-
-    
-
-
-    radius = 0.7
-
-    # centroidf = vtkMeanTeeth([6,11,3,14],property='Universal_ID')
-    centroidf = vtkMeanTeeth([tooth_anterior_right,tooth_anterior_left,tooth_posterior_right,tooth_posterior_left],property='Universal_ID')
-
-    # centroidf = vtkMeanTeeth([2,5,12,15,6,11,3,14],property='Universal_ID')
+    """
+    Add the point array Butterfly to surf. To compute several patches on the same surf,
+    keep a Method.session.PatchSession instead, it does not recompute what depends only on the mesh.
+    mode is 'fill' (band and flood fill from the middle) or 'inside' (point in polygon), see PatchSession.compute
+    """
+    from Method.session import PatchSession
+
+    parameter = ButterflyParameter(tooth_anterior_right,tooth_anterior_left,tooth_posterior_right,tooth_posterior_left,
+                                   ratio_anterior_right,ratio_anterior_left,ratio_posterior_left,ratio_posterior_right,
+                                   adjust_anterior_right,adjust_anterior_left,adjust_posterior_right,adjust_posterior_left)
     try :
-        surf_tmp = orientation(surf_tmp,[[-0.5,-0.5,0],[0,0,0],[0.5,-0.5,0]],
-                                   ['3','5','12','14'])
-        centroid = centroidf(surf_tmp)
-
+        PatchSession(surf,backend=backend).update(parameter,mode=mode)
     except ToothNoExist as error:
         print(f' Error {error}')
         # quit()
         return
-    V = torch.tensor(vtk_to_numpy(surf_tmp.GetPoints().GetData())).to(torch.float32)
-    F = torch.tensor(vtk_to_numpy(surf_tmp.GetPolys().GetData()).reshape(-1, 4)[:,1:]).to(torch.int64)
-
-    centroid_anterior_right = centroid[str(tooth_anterior_right)] + np.array([0,adjust_anterior_right,0],dtype=np.float32)
-    centroid_anterior_left = centroid[str(tooth_anterior_left)] + np.array([0,adjust_anterior_left,0],dtype=np.float32)
-
-
-    centroid_posterior_rigth = centroid[str(tooth_posterior_right)] + np.array([0,adjust_posterior_right,0],dtype=np.float32)
-    centroid_posterior_left = centroid[str(tooth_posterior_left)]+ np.array([0,adjust_posterior_left ,0],dtype=np.float32)
-
-
-    landmark_anterior_left = (1-ratio_anterior_left) * centroid_anterior_right + ratio_anterior_left * centroid_anterior_left
-    landmark_anterior_right = (1-ratio_anterior_right) * centroid_anterior_left + ratio_anterior_right * centroid_anterior_right
-
-    landmark_posterior_left = (1-ratio_posterior_left) * centroid_posterior_rigth + ratio_posterior_left * centroid_posterior_left
-    landmark_posterior_right = (1- ratio_posterior_right) * centroid_posterior_left + ratio_posterior_right * centroid_posterior_rigth
-    landmark_middle_posterior = (landmark_posterior_left + landmark_posterior_right) / 2
-
-
-
-
-    middle = (landmark_posterior_left + landmark_anterior_right) / 2
-
-
-
-    #rectangle limit
-    t = np.arange(0,1,0.01)
-    haut_seg = Segment2D(landmark_anterior_left,landmark_anterior_right)
-    haut_seg = torch.tensor(haut_seg(t)).t().to(torch.float32)
-    # print(haut_seg)
-    dis = torch.cdist(haut_seg,V[:,:2])
-    arg_haut_seg = torch.unique(torch.argwhere(dis < radius).squeeze()[:,1])
-
-
-    bas_seg = Segment2D(landmark_posterior_left,landmark_posterior_right)
-    bas_seg = torch.tensor(bas_seg(t)).t().to(torch.float32)
-    dis = torch.cdist(bas_seg,V[:,:2])
-    arg_bas_seg = torch.unique(torch.argwhere(dis < radius).squeeze()[:,1])
-
-
-
-    
-
-
-
-    #bezier droite
-    bezier = Bezier_bled(landmark_posterior_right[:2],landmark_middle_posterior[:2],landmark_anterior_right[:2],0.01)
-    v_bezier = bezier - np.expand_dims(landmark_posterior_right[:2],axis=0)
-    v_norm_bezier = np.expand_dims(np.linalg.norm(v_bezier, axis=1),axis=0).T
-    v_bezier = v_bezier / v_norm_bezier
-
-    v = np.expand_dims(landmark_anterior_right[:2] - landmark_posterior_right[:2], axis=0).T
-    v_norm = np.linalg.norm(v)
-    v = v / v_norm
-    # print(f'v {v}')
-    P = np.matmul(v , v.T)
-
-    bezier_proj = ( P @ v_bezier.T).T *v_norm_bezier + landmark_posterior_right[:2]
-    sym = 2*bezier_proj - bezier
-
-    bezier = torch.tensor(sym,dtype=torch.float32)
-    dist = torch.cdist(bezier,V[:,:2])
-    arg_bezier = torch.argwhere(dist < radius)[:,1]
-
-
-
-
-
-    #bezier gauche
-    bezier2 = Bezier_bled(landmark_posterior_left[:2],landmark_middle_posterior[:2],landmark_anterior_left[:2],0.01)
-    v_bezier = bezier2 - np.expand_dims(landmark_posterior_left[:2],axis=0)
-    v_norm_bezier = np.expand_dims(np.linalg.norm(v_bezier, axis=1),axis=0).T
-    v_bezier = v_bezier / v_norm_bezier
-
-    v = np.expand_dims(landmark_anterior_left[:2] - landmark_posterior_left[:2], axis=0).T
-    v_norm = np.linalg.norm(v)
-    v = v / v_norm
-    # print(f'v {v}')
-    P = np.matmul(v , v.T)
-
-    bezier_proj = ( P @ v_bezier.T).T *v_norm_bezier + landmark_posterior_left[:2]
-    sym = 2*bezier_proj - bezier2
-
-    bezier2 = torch.tensor(sym,dtype=torch.float32)
-    dist = torch.cdist(bezier2,V[:,:2])
-    print(f'bezier2.shape {bezier2.shape}, V[:,;2].shape {V[:,:2].shape}')
-    arg_bezier2 = torch.argwhere(dist < radius)[:,1]
-
-
-
-
-
-    V_label = torch.zeros((V.shape[0]))
-    V_label[arg_haut_seg] = 1
-    V_label[arg_bas_seg] = 1
-    V_label[arg_bezier] = 1
-    V_label[arg_bezier2] = 1
-
-
-
-    dist = torch.cdist(torch.tensor(middle[:2]).unsqueeze(0),V[:,:2]).squeeze()
-    middle_arg = torch.argmin(dist)
-    V_label = Dilation(middle_arg,F,V_label)
-
-
-
-    V_labels_prediction = numpy_to_vtk(V_label.cpu().numpy())
-    V_labels_prediction.SetName('Butterfly')
-
-
-
-    surf.GetPointData().AddArray(V_labels_prediction)
 
 
 
     # return surf
-
-
-
-
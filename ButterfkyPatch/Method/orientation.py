@@ -1,7 +1,9 @@
+import threading
 import numpy as np
-from Method.util import vtkMeanTeeth
-import vtk
-from Method.transformation import RotationMatrix, TransformSurf
+from collections import OrderedDict
+from Method.util import vtkMeanTeeth, MeshKey, GetToothIndex
+from vtkmodules.util.numpy_support import vtk_to_numpy
+from Method.transformation import RotationMatrix, TransformSurf, TransformPoints
 
 cross = lambda a,b: np.cross(a,b)
 
@@ -24,8 +26,12 @@ def make_vector(points2,point1):
 
 
 
-def orientation(source,target,landmarks):
-
+def OrientationMatrix(source,target,landmarks,property='Universal_ID'):
+    """
+    Return the 4x4 matrix aligning the mean of the teeth landmarks of source on target.
+    landmarks are the teeth [left, middle1, middle2, right], target the points [left, middle, right],
+    property the name of the teeth label array
+    """
 
     left =landmarks[0]
     middle1 = landmarks[1]
@@ -33,7 +39,7 @@ def orientation(source,target,landmarks):
     right = landmarks[3]
 
          
-    meanTeeth = vtkMeanTeeth([int(left),int(middle1),int(middle2),int(right)],property='Universal_ID')
+    meanTeeth = vtkMeanTeeth([int(left),int(middle1),int(middle2),int(right)],property=property)
     mean_source = meanTeeth(source)
 
     left_source, middle1_source, middle2_source , right_source = mean_source[left], mean_source[middle1], mean_source[middle2],mean_source[right]
@@ -98,17 +104,141 @@ def orientation(source,target,landmarks):
 
     # matrix = np.matmul(matrix,matrix_translation)
 
+    return matrix
+
+
+
+def LandmarkFrame(points):
+    """
+    Return the orthonormal frames (B, 3, 3) of the stacked landmarks points (B, 3, 3) [left, middle, right],
+    the columns are the vectors perpen, direction and normal of make_vector
+    """
+    left , middle, right = points[:,0], points[:,1], points[:,2]
+    unit = lambda vector : vector / np.linalg.norm(vector,axis=1,keepdims=True)
+    perpen = unit(left - right)
+    normal = unit(cross(unit(right - middle),unit(left - middle)))
+    direction = unit(cross(normal,perpen))
+    return np.stack([perpen,direction,normal],axis=2)
+
+
+
+def AlignmentMatrix(source,target):
+    """
+    Return the rigid 4x4 matrices (B, 4, 4) aligning the stacked landmarks source (B, 3, 3) on target (3, 3)
+    or (B, 3, 3), the landmarks are the points [left, middle, right].
+    The rotation maps the frame of the source on the frame of the target (see LandmarkFrame), as the two
+    rotations of OrientationMatrix do. It is found for all the scans at once by a batched SVD of the frame
+    vectors (Kabsch), then the translation aligns the means of the landmarks.
+    """
+    source = np.asarray(source,dtype=np.float64).reshape(-1,3,3)
+    target = np.broadcast_to(np.asarray(target,dtype=np.float64),source.shape)
+
+    covariance = np.matmul(LandmarkFrame(source),np.transpose(LandmarkFrame(target),(0,2,1)))
+    u , _, vt = np.linalg.svd(covariance)
+    v , ut = np.transpose(vt,(0,2,1)), np.transpose(u,(0,2,1))
+    # no reflection
+    v[:,:,2] *= np.sign(np.linalg.det(np.matmul(v,ut)))[:,None]
+    rotation = np.matmul(v,ut)
+
+    matrix = np.zeros((len(source),4,4))
+    matrix[:,:3,:3] = rotation
+    matrix[:,:3,3] = target.mean(axis=1) - np.einsum('bij,bj->bi',rotation,source.mean(axis=1))
+    matrix[:,3,3] = 1
+    return matrix
+
+
+
+def OrientationMatrices(indices,target,landmarks):
+    """
+    Return the matrices (B, 4, 4) of OrientationMatrix for B scans in one call
+
+    Parameters
+    ----------
+    indices : list
+        ToothIndex of each scan, for example GetToothIndex(surf) or PatchSession.tooth_index
+    target : list
+        Points [left, middle, right]
+    landmarks : list
+        Teeth [left, middle1, middle2, right]
+
+    Raises
+    ------
+    ToothNoExist
+        A tooth of landmarks is missing in a scan
+    """
+    teeth = [int(tooth) for tooth in landmarks]
+    centroid = np.stack([index.mean(teeth) for index in indices]).astype(np.float64)
+    source = np.stack([centroid[:,0],(centroid[:,1] + centroid[:,2]) / 2,centroid[:,3]],axis=1)
+    return AlignmentMatrix(source,target)
+
+
+
+def OrientSessions(sessions):
+    """
+    Compute the orientation of every PatchSession of sessions with one OrientationMatrices call,
+    instead of one OrientationMatrix per session
+    """
+    sessions = list(sessions)
+    if not sessions :
+        return
+    matrices = OrientationMatrices([session.tooth_index for session in sessions],sessions[0].target,sessions[0].landmarks)
+    for session, matrix in zip(sessions,matrices):
+        # setting the cached property skips its computation
+        session.orientation = Orientation(matrix,TransformPoints(session.vertices,matrix),session.tooth_index)
 
 
-    
 
+def orientation(source,target,landmarks):
+    matrix = OrientationMatrix(source,target,landmarks)
+
+    output = TransformSurf(source,matrix)
 
 
-    output = vtk.vtkPolyData()
-    output.DeepCopy(source)
+    return output
 
-    
-    output = TransformSurf(output,matrix)
 
 
-    return output
\ No newline at end of file
+
+class Orientation:
+    """
+    Orientation of a surface: the 4x4 matrix, the oriented vertices and the ToothIndex of the source.
+    The oriented centroids are the source centroids multiplied by the matrix, no need to scan the labels again.
+    """
+    def __init__(self,matrix,vertices,index) -> None:
+        self.matrix = matrix
+        self.vertices = vertices
+        self.vertices.flags.writeable = False
+        self.index = index
+
+    def centroid(self,list_teeth):
+        means = self.index.mean(list_teeth) @ self.matrix[:3,:3].T + self.matrix[:3,3]
+        return {str(tooth) : mean.astype(np.float32) for tooth, mean in zip(list_teeth,means)}
+
+
+
+_orientation_cache = OrderedDict()
+_orientation_lock = threading.Lock()
+ORIENTATION_CACHE_SIZE = 4
+
+
+def GetOrientation(surf,target,landmarks,property='Universal_ID'):
+    """
+    Return the Orientation of surf, memoized in a LRU keyed by the geometry and the labels of surf,
+    the last ORIENTATION_CACHE_SIZE results are kept
+    """
+    key = MeshKey(surf,property) + (tuple(map(tuple,target)),tuple(landmarks))
+    with _orientation_lock:
+        if key in _orientation_cache:
+            _orientation_cache.move_to_end(key)
+            return _orientation_cache[key]
+
+    matrix = OrientationMatrix(surf,target,landmarks,property)
+    # the points of surf are read through a view, the only copy is the oriented vertices
+    vertices = TransformPoints(vtk_to_numpy(surf.GetPoints().GetData()),matrix)
+    result = Orientation(matrix,vertices,GetToothIndex(surf,property))
+
+    with _orientation_lock:
+        _orientation_cache[key] = result
+        if len(_orientation_cache) > ORIENTATION_CACHE_SIZE:
+            _orientation_cache.popitem(last=False)
+    return result
\ No newline at end of file
@@ -1,94 +1,211 @@
-from typing import Any
-import torch
-
-# def wrap_error(func):
-#     nbloop =1
-#     def wrapper(arg_point,F):
-#         error = False
-#         nbloop = 1
-#         neighbours = torch.tensor([]).cuda()
-#         while error :
-#             arg_point_loop = 
-#             try :
-#                 neighbours_ = func(arg_point,F)
-#             except RuntimeError :
-#                 error = True
-
-#             neighbours = torch.cat([neighbours,neighbours_])
-
-#         return neighbours
-
-#     return wrapper
-
-
-# class WrappError:
-#     def __init__(self,func) -> None:
-#         self._func = func
-#         self.nbloop = 1
-
-#     def __call__(self,arg_point,F) :
-#         error = False
-#         neighbours = torch.tensor([]).cuda()
-#         while error :
-#             arg_point_loop = 
-#             try :
-#                 neighbours_ = func(arg_point,F)
-#             except RuntimeError :
-#                 error = True
-
-#             neighbours = torch.cat([neighbours,neighbours_])
-
-#         return neighbours
-    
-
-#     def limitTest()
-
-
-def Difference(t1,t2):
-    # print(f't2 : {t2}')
-    # print(f't1 shape {t1.shape}')
-    t1 = t1.unsqueeze(0).expand(len(t2),-1)
-    t2 = t2.unsqueeze(1)
-    d = torch.count_nonzero(t1 -t2,dim=-1)
-    arg = torch.argwhere(d == t1.shape[1])
-    dif = torch.unique(t2[arg])
-    return dif
-
-
-def Neighbours(arg_point,F):
-    neighbours = torch.tensor([]).cuda()
-    F2 = F.unsqueeze(0).expand(len(arg_point),-1,-1)
-    arg_point = arg_point.unsqueeze(1).unsqueeze(2)
-    arg = torch.argwhere((F2-arg_point) == 0)
-    # print(f' arg {arg.shape}, arg : {arg}')
-
-    neighbours = torch.unique(F[arg[:,1],:])
-    return neighbours
-
-
-
-
-
-
-
-def Dilation(arg_point,F,texture):
-    # print(f'arg point {arg_point}')
-    arg_point = torch.tensor([arg_point]).cuda().to(torch.int64)
-    F = F.cuda()
-    texture = texture.cuda()
-    neighbour = Neighbours(arg_point,F)
-    arg_texture = torch.argwhere(texture == 1).squeeze()
-    # dif = NoIntersection(arg_texture,neighbour)
-    dif = neighbour.to(torch.int64)
-    dif  = Difference(arg_texture,dif)
-    n = 0
-    while len(dif)!= 0 :#and n < 50:
-        # print(f'n = {n}, len : {len(dif)}')
-        texture[dif] = 1
-        neighbour = Neighbours(dif,F)
-        arg_texture = torch.argwhere(texture == 1).squeeze()
-        # dif = NoIntersection(arg_texture,neighbour)
-        dif = neighbour.to(torch.int64)
-        dif  = Difference(arg_texture,dif)
-        n+=1
-    return texture
\ No newline at end of file
+import numpy as np
+from Method.backend import getBackend, toNumpy
+from Method.trace import IsTracing, TraceCount
+
+
+
+
+def IndexDtype(size):
+    """
+    Smallest signed integer dtype able to index size elements, int32 or int64
+    """
+    return 'int32' if size < 2**31 else 'int64'
+
+
+
+
+class VertexAdjacency:
+    """
+    Vertex to vertex adjacency of a triangle mesh stored in CSR form.
+    The neighbours of the vertex i are indices[offsets[i]:offsets[i+1]].
+    offsets and indices are int32 while the mesh has less than 2^31 edges, int64 otherwise.
+
+    Parameters
+    ----------
+    F : torch.tensor or np.array
+        Faces of the mesh (nb_face, 3)
+    number_vertex : int
+        Number of vertices of the mesh, by default the highest index in F + 1
+    backend : str or backend
+        Backend where offsets and indices are stored, see Method.backend.getBackend
+    """
+    def __init__(self,F,number_vertex=None,backend=None) -> None:
+        self.backend = getBackend(backend)
+        F = toNumpy(F).astype(np.int64,copy=False)
+        if number_vertex is None :
+            number_vertex = int(F.max()) + 1 if F.size else 0
+        self.number_vertex = number_vertex
+
+        source = np.concatenate([F[:,0],F[:,1],F[:,2],F[:,1],F[:,2],F[:,0]])
+        target = np.concatenate([F[:,1],F[:,2],F[:,0],F[:,0],F[:,1],F[:,2]])
+        # sort and mask rather than np.unique, its hash path holds the GIL and is slower on large meshes
+        edge = np.sort(source * number_vertex + target)
+        if len(edge) != 0 :
+            edge = edge[np.concatenate([[True],edge[1:] != edge[:-1]])]
+        source , target = np.divmod(edge,max(number_vertex,1))
+
+        self.dtype = IndexDtype(max(number_vertex,len(edge)))
+        offsets = np.zeros(number_vertex + 1,dtype=self.dtype)
+        np.cumsum(np.bincount(source,minlength=number_vertex),out=offsets[1:])
+        self.offsets = self.backend.asarray(offsets)
+        self.indices = self.backend.asarray(target.astype(self.dtype))
+
+    @classmethod
+    def fromCSR(cls,offsets,indices,backend=None):
+        """
+        Rebuild the adjacency from its offsets and indices, for example read from Method.cache
+        """
+        adjacency = cls.__new__(cls)
+        adjacency.backend = getBackend(backend)
+        adjacency.number_vertex = len(offsets) - 1
+        adjacency.dtype = np.dtype(indices.dtype).name
+        adjacency.offsets = adjacency.backend.asarray(offsets)
+        adjacency.indices = adjacency.backend.asarray(indices)
+        return adjacency
+
+    def degree(self,arg_point):
+        return self.offsets[arg_point+1] - self.offsets[arg_point]
+
+    def neighbours(self,arg_point):
+        """
+        Return the neighbours of every vertex in arg_point, concatenated (a vertex can appear several times)
+        """
+        backend = self.backend
+        start = self.offsets[arg_point]
+        count = self.offsets[arg_point+1] - start
+        shift = backend.repeat(start - backend.cumsum(count) + count,count)
+        return self.indices[shift + backend.arange(len(shift))]
+
+
+
+
+def Dilation(arg_point,F,texture,adjacency=None,backend=None,progress=None):
+    """
+    Flood fill texture from the vertex arg_point, the vertices where texture == 1 stop the propagation.
+    Breadth first search over the CSR adjacency, each call is O(V+E).
+
+    Parameters
+    ----------
+    arg_point : int
+        Index of the seed vertex
+    F : torch.tensor or np.array
+        Faces of the mesh, only used when adjacency is None
+    texture : torch.tensor or np.array
+        Label of each vertex, 1 for the border, uint8 is enough
+    adjacency : VertexAdjacency
+        Adjacency of the mesh, build it once per mesh to reuse it between the calls
+    backend : str or backend
+        Backend of the computation, the one of adjacency when it is given
+    progress : callable, optional
+        Called with ('fill', size of the frontier) at each iteration, it can raise to stop the fill
+
+    Returns
+    -------
+    torch.tensor or np.array
+        texture on the backend with the filled vertices set to 1
+    """
+    if adjacency is None :
+        adjacency = VertexAdjacency(F,len(texture),backend=backend)
+    backend = adjacency.backend
+
+    texture = backend.asarray(texture)
+    visited = texture == 1
+    # scratch buffer to remove the duplicates of the frontier in O(len(frontier))
+    position = backend.zeros(len(visited),dtype=adjacency.dtype)
+
+    tracing = IsTracing()
+    frontier_size = []
+
+    frontier = backend.asarray([int(arg_point)],dtype=adjacency.dtype)
+    candidate = backend.concatenate([frontier[adjacency.degree(frontier) > 0],adjacency.neighbours(frontier)])
+    while len(candidate) != 0 :
+        candidate = candidate[~visited[candidate]]
+        order = backend.arange(len(candidate),dtype=adjacency.dtype)
+        position[candidate] = order
+        frontier = candidate[position[candidate] == order]
+        visited[frontier] = True
+        candidate = adjacency.neighbours(frontier)
+        if tracing :
+            frontier_size.append(len(frontier))
+        if progress is not None :
+            progress('fill',len(frontier))
+
+    if tracing :
+        TraceCount('Dilation',iterations=len(frontier_size),filled=sum(frontier_size),frontier=frontier_size)
+
+    texture[visited] = 1
+    return texture
+
+
+
+
+def MultiDilation(arg_seeds,texture,adjacency,labels=None,progress=None):
+    """
+    Flood fill several regions in a single breadth first search over the CSR adjacency.
+    The region i grows from arg_seeds[i] with the label labels[i], every vertex where texture != 0 (the borders
+    of all the regions) stops the propagation of every region, so the regions do not overlap.
+    A vertex reached by several regions in the same iteration takes the lowest label.
+
+    Parameters
+    ----------
+    arg_seeds : list of int
+        Index of the seed vertex of each region
+    texture : torch.tensor or np.array
+        Label of each vertex, the label of its region for the borders and 0 elsewhere
+    adjacency : VertexAdjacency
+        Adjacency of the mesh
+    labels : list of int, optional
+        Label of each region, 1 to len(arg_seeds) by default
+    progress : callable, optional
+        Called with ('fill', size of the frontier) at each iteration, it can raise to stop the fill
+
+    Returns
+    -------
+    torch.tensor or np.array
+        texture on the backend with the filled vertices set to the label of their region
+
+    Raises
+    ------
+    ValueError
+        A label is not positive, 0 is the unlabeled texture
+    """
+    backend = adjacency.backend
+    if labels is None :
+        labels = range(1,len(arg_seeds)+1)
+    if min(labels,default=1) < 1 :
+        raise ValueError(f'The labels of the regions must be positive, got {list(labels)}')
+
+    texture = backend.asarray(texture)
+    if len(arg_seeds) == 0 :
+        return texture
+    visited = texture != 0
+    number_label = int(max(labels)) + 1
+
+    tracing = IsTracing()
+    frontier_size = []
+
+    frontier = backend.asarray([int(arg) for arg in arg_seeds],dtype='int64')
+    frontier_label = backend.asarray(list(labels),dtype='int64')
+    seed = adjacency.degree(frontier) > 0
+    candidate = backend.concatenate([frontier[seed],adjacency.neighbours(frontier)])
+    candidate_label = backend.concatenate([frontier_label[seed],backend.repeat(frontier_label,adjacency.degree(frontier))])
+    while len(candidate) != 0 :
+        keep = ~visited[candidate]
+        # sorted by vertex then label, the first pair of each vertex has its lowest label
+        key = backend.unique(backend.asarray(candidate[keep],dtype='int64') * number_label + candidate_label[keep])
+        frontier , frontier_label = key // number_label, key % number_label
+        first = frontier != backend.concatenate([frontier[:1] - 1,frontier[:-1]])
+        frontier , frontier_label = frontier[first], frontier_label[first]
+        visited[frontier] = True
+        texture[frontier] = backend.asarray(frontier_label,dtype=texture.dtype)
+        candidate = adjacency.neighbours(frontier)
+        candidate_label = backend.repeat(frontier_label,adjacency.degree(frontier))
+        if tracing :
+            frontier_size.append(len(frontier))
+        if progress is not None :
+            progress('fill',len(frontier))
+
+    if tracing :
+        TraceCount('MultiDilation',regions=len(arg_seeds),iterations=len(frontier_size),filled=sum(frontier_size),frontier=frontier_size)
+
+    return texture
@@ -0,0 +1,87 @@
+import numpy as np
+
+from Method.trace import TraceStage
+
+
+
+
+def SurfaceArea(vertices,faces,sample=65536):
+    """
+    Area of a triangle mesh, estimated from an evenly strided sample of sample faces
+    """
+    step = max(len(faces) // sample,1)
+    sampled = faces[::step]
+    a , b, c = (np.asarray(vertices[sampled[:,i]],dtype=np.float64) for i in range(3))
+    return np.linalg.norm(np.cross(b - a,c - a),axis=1).sum() / 2 * len(faces) / max(len(sampled),1)
+
+
+def Decimate(vertices,faces,number_vertex):
+    """
+    Decimate a triangle mesh to about number_vertex vertices by vertex clustering: the vertices in the same
+    cell of a uniform grid of size sqrt(area / number_vertex) are merged at their mean, the faces with two
+    merged vertices are removed. It is linear in the size of the mesh and gives the cluster of every vertex,
+    vtkQuadricDecimation is too slow on a full resolution scan.
+
+    Returns
+    -------
+    np.array
+        Vertices of the proxy (nb_cluster, 3)
+    np.array
+        Faces of the proxy (nb_face, 3)
+    np.array
+        Index of the proxy vertex of each vertex of the mesh
+    float
+        Size of the grid
+    """
+    vertices = np.asarray(vertices)
+    # the grid only needs the order of magnitude of the area
+    spacing = float(np.sqrt(SurfaceArea(vertices,faces) / number_vertex))
+
+    cell = np.floor((vertices - vertices.min(axis=0)) / spacing).astype(np.int64)
+    shape = cell.max(axis=0) + 1
+    key = (cell[:,0] * shape[1] + cell[:,1]) * shape[2] + cell[:,2]
+    order = np.argsort(key,kind='stable')
+    key_sorted = key[order]
+    start = np.flatnonzero(np.concatenate([[True],key_sorted[1:] != key_sorted[:-1]]))
+
+    cluster = np.empty(len(vertices),dtype=faces.dtype)
+    cluster[order] = np.cumsum(np.concatenate([[False],key_sorted[1:] != key_sorted[:-1]]))
+    count = np.diff(np.append(start,len(vertices)))
+    proxy_vertices = (np.add.reduceat(vertices[order],start,axis=0,dtype=np.float64) / count[:,None]).astype(np.float32)
+
+    proxy_faces = cluster[faces]
+    keep = (proxy_faces[:,0] != proxy_faces[:,1]) & (proxy_faces[:,1] != proxy_faces[:,2]) & (proxy_faces[:,2] != proxy_faces[:,0])
+    return proxy_vertices, proxy_faces[keep], cluster, spacing
+
+
+
+
+class ProxyMesh:
+    """
+    Decimated copy of a scan for the Butterfly pipeline, see PatchSession.computeProxy.
+    The session of the proxy has no vtkPolyData, it reuses the orientation matrix and the tooth index
+    of the full scan, and its band is at least one cluster wide so the fill can not leak between the proxy vertices.
+
+    Parameters
+    ----------
+    session : PatchSession
+        Session of the full resolution scan
+    number_vertex : int
+        Target number of vertices of the proxy
+    """
+    def __init__(self,session,number_vertex) -> None:
+        from Method.session import PatchSession
+        from Method.orientation import Orientation
+        from Method.transformation import TransformPoints
+
+        with TraceStage('decimate',vertices=len(session.vertices),target=number_vertex) as stage:
+            vertices , faces, self.cluster, self.spacing = Decimate(session.vertices,session.faces,number_vertex)
+            stage.set(proxy=len(vertices))
+
+        self.session = PatchSession(None,backend=session.backend,property=session.property)
+        # setting the cached properties skips their computation
+        self.session.vertices = vertices
+        self.session.faces = faces
+        self.session.radius = max(session.radius,self.spacing)
+        orientation = session.orientation
+        self.session.orientation = Orientation(orientation.matrix,TransformPoints(vertices,orientation.matrix),orientation.index)
@@ -0,0 +1,359 @@
+import numpy as np
+from functools import cached_property
+from vtkmodules.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+
+from Method.backend import getBackend
+from Method.propagation import VertexAdjacency, Dilation, MultiDilation, IndexDtype
+from Method.spatial import SpatialIndex, PointInPolygon
+from Method.orientation import GetOrientation
+from Method.util import GetToothIndex, ContentHash, LabelProperty, NoSegmentationSurf
+from Method.make_butterfly import ButterflyParameter, ButterflyLandmark, ButterflyCurve, ButterflyPolygon
+from Method.curve import CurveBatch
+from Method.trace import TraceStage
+from Method.proxy import ProxyMesh
+
+
+
+
+def NoProgress(stage,value=None):
+    pass
+
+
+
+
+class PatchSession:
+    """
+    Keep everything derived from the mesh warm for the life of a scan: vertices, faces, adjacency,
+    tooth index, orientation and spatial indices. They are computed on first use, update() and draw()
+    only redo the steps depending on their parameters (landmarks, curve rasterization and fill).
+
+    Parameters
+    ----------
+    surf : vtk.vtkPolyData
+        Scan, its points and labels must not be modified during the session
+    backend : str or backend
+        Backend of the fill, see Method.backend.getBackend
+    property : str
+        Name of the teeth label array, an other point array of surf is used when surf does not have it
+        (see Method.util.LabelProperty)
+    proxy_size : int
+        Number of vertices of the decimated proxy used by compute with proxy=True
+    """
+    target = [[-0.5,-0.5,0],[0,0,0],[0.5,-0.5,0]]
+    landmarks = ['3','5','12','14']
+    radius = 0.7
+    radius_draw = 0.5
+    modes = ['fill','inside']
+
+    def __init__(self,surf,backend=None,property='Universal_ID',proxy_size=100000) -> None:
+        self.surf = surf
+        self.backend = getBackend(backend)
+        # resolved once, every step of the session reads the same label array
+        self.property = LabelProperty(surf,property) if surf is not None else property
+        self.proxy_size = proxy_size
+
+    @cached_property
+    def vertices(self):
+        return np.asarray(vtk_to_numpy(self.surf.GetPoints().GetData()),dtype=np.float32)
+
+    @cached_property
+    def faces(self):
+        polys = self.surf.GetPolys()
+        if hasattr(polys,'GetConnectivityArray'):
+            faces = vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1,3)
+        else :
+            faces = vtk_to_numpy(polys.GetData()).reshape(-1,4)[:,1:]
+        return faces.astype(IndexDtype(len(self.vertices)),copy=False)
+
+    @cached_property
+    def adjacency(self):
+        with TraceStage('adjacency',vertices=len(self.vertices),faces=len(self.faces)):
+            return VertexAdjacency(self.faces,len(self.vertices),backend=self.backend)
+
+    @cached_property
+    def tooth_index(self):
+        with TraceStage('tooth_index',vertices=len(self.vertices)):
+            return GetToothIndex(self.surf,self.property)
+
+    @cached_property
+    def orientation(self):
+        with TraceStage('orientation',vertices=len(self.vertices)):
+            return GetOrientation(self.surf,self.target,self.landmarks,self.property)
+
+    @cached_property
+    def index_oriented(self):
+        with TraceStage('spatial_index',vertices=len(self.vertices),dim=2):
+            return SpatialIndex(self.orientation.vertices[:,:2],self.radius)
+
+    @cached_property
+    def order_y(self):
+        return np.argsort(self.orientation.vertices[:,1],kind='stable')
+
+    @cached_property
+    def mesh_hash(self):
+        with TraceStage('mesh_hash',vertices=len(self.vertices)):
+            labels = self.surf.GetPointData().GetScalars(self.property)
+            if labels is None :
+                raise NoSegmentationSurf(self.property)
+            return ContentHash(self.vertices,self.faces,vtk_to_numpy(labels))
+
+    @cached_property
+    def proxy(self):
+        return ProxyMesh(self,self.proxy_size)
+
+    @cached_property
+    def index(self):
+        with TraceStage('spatial_index',vertices=len(self.vertices),dim=3):
+            return SpatialIndex(self.vertices,self.radius_draw)
+
+
+    def fill(self,arg_border,arg_seed,progress=None):
+        with TraceStage('fill',border=len(arg_border),backend=self.backend.name) as stage:
+            V_label = np.zeros(len(self.vertices),dtype=np.uint8)
+            V_label[arg_border] = 1
+            V_label = self.backend.numpy(Dilation(arg_seed,None,V_label,adjacency=self.adjacency,progress=progress))
+            stage.set(labeled=int(np.count_nonzero(V_label)))
+        return V_label
+
+
+    def inside(self,polygon,arg_border=None):
+        with TraceStage('inside',edges=len(polygon)) as stage:
+            V_label = PointInPolygon(self.orientation.vertices[:,:2],polygon,order=self.order_y).astype(np.uint8)
+            if arg_border is not None :
+                V_label[arg_border] = 1
+            stage.set(labeled=int(np.count_nonzero(V_label)))
+        return V_label
+
+
+    def compute(self,parameter : ButterflyParameter,mode='fill',band=True,progress=None,proxy=False,tolerance=None):
+        """
+        Return the Butterfly label of each vertex, raise ToothNoExist if a tooth of parameter is missing
+
+        Parameters
+        ----------
+        parameter : ButterflyParameter
+            Teeth, ratios and adjusts of the outline
+        mode : str
+            'fill' draws the band of the outline and flood fills it from the middle,
+            'inside' labels the vertices inside the closed outline polygon in the oriented XY plane,
+            it does not iterate and can not leak
+        band : bool
+            With mode 'inside', also label the vertices of the band to keep the border
+        progress : callable, optional
+            Called with (stage, value) after the orientation, the band and each fill iteration,
+            see Method.task.PatchTask
+        proxy : bool
+            Run the pipeline on the decimated proxy of proxy_size vertices and transfer the labels
+            to the scan, see computeProxy
+        tolerance : float, optional
+            With proxy, the vertices within tolerance of the outline are labeled exactly
+        """
+        if progress is None :
+            progress = NoProgress
+        if mode not in self.modes :
+            raise ValueError(f'Unknown mode {mode}, choose between {self.modes}')
+        if proxy :
+            return self.computeProxy(parameter,mode=mode,band=band,tolerance=tolerance,progress=progress)
+        self.orientation
+        progress('orientation')
+        landmark , curves = self.butterflyCurve(parameter)
+
+        arg_border = None
+        if mode == 'fill' or band :
+            arg_border = self.butterflyBand(curves)
+            progress('band',len(arg_border))
+
+        if mode == 'inside':
+            return self.inside(ButterflyPolygon(curves)[0],arg_border)
+
+        return self.fill(arg_border,self.butterflySeed(landmark),progress=progress)
+
+
+    def computeProxy(self,parameter : ButterflyParameter,mode='fill',band=True,tolerance=None,progress=None):
+        """
+        Return the Butterfly label of each vertex computed on the decimated proxy. Each vertex takes the label
+        of its proxy vertex, then the vertices within tolerance of the outline are labeled exactly:
+        inside the outline polygon or in the band. The labels can only differ from compute where the fill
+        and the polygon disagree, far from the outline.
+
+        Parameters
+        ----------
+        tolerance : float, optional
+            Distance to the outline of the exact refinement, by default radius + 2 cluster sizes.
+            It must stay larger than radius to keep the exact band.
+
+        Raises
+        ------
+        ValueError
+            tolerance is lower than radius
+        """
+        if tolerance is not None and tolerance < self.radius :
+            raise ValueError(f'The tolerance {tolerance} must be at least the radius of the band {self.radius}')
+        proxy = self.proxy
+        if tolerance is None :
+            tolerance = self.radius + 2 * proxy.spacing
+        V_proxy = proxy.session.compute(parameter,mode=mode,band=band,progress=progress)
+        with TraceStage('transfer',vertices=len(self.vertices),proxy=len(V_proxy)):
+            V_label = V_proxy[proxy.cluster]
+
+        landmark , curves = self.butterflyCurve(parameter)
+        start , end, _ = curves.segments()
+        with TraceStage('refine',tolerance=tolerance) as stage:
+            # a vertex and its proxy vertex are in the same cell, less than 2 spacing apart
+            near = np.zeros(len(V_proxy),dtype=bool)
+            near[proxy.session.index_oriented.querySegment(start,end,tolerance + 2 * proxy.spacing)] = True
+            arg_near = np.flatnonzero(near[proxy.cluster])
+            V_near = self.orientation.vertices[arg_near,:2]
+            V_label[arg_near] = PointInPolygon(V_near,ButterflyPolygon(curves)[0])
+            if mode == 'fill' or band :
+                index = SpatialIndex(V_near,self.radius)
+                V_label[arg_near[index.querySegment(start,end,self.radius)]] = 1
+            stage.set(refined=len(arg_near))
+        progress('refine',len(arg_near))
+        return V_label
+
+
+    def computeDraw(self,outlinePoints,mid,progress=None,spline=False):
+        """
+        Return the label of each vertex for the region inside the closed outline containing mid.
+        The outline links outlinePoints with segments, for example the curve points of a Slicer closed curve.
+        With spline True, outlinePoints are bare control points linked by the closed uniform Catmull-Rom spline
+        going through them.
+        """
+        if progress is None :
+            progress = NoProgress
+        arg_outline = self.drawBand(outlinePoints,spline)
+        progress('band',len(arg_outline))
+        return self.fill(arg_outline,self.drawSeed(mid),progress=progress)
+
+
+    def computePatches(self,patches,labels=None,progress=None):
+        """
+        Return the label of each vertex for several patches filled in a single pass, 0 outside of every patch.
+        The bands of all the patches stop the propagation of every patch, so the patches do not overlap;
+        a vertex in the bands of several patches takes the label of the last one.
+
+        Parameters
+        ----------
+        patches : list
+            ButterflyParameter for a Butterfly outline, or (outlinePoints, mid) or (outlinePoints, mid, spline)
+            for a drawn outline, see computeDraw
+        labels : list of int, optional
+            Label of each patch, positive, 1 to len(patches) by default
+        progress : callable, optional
+            Called with (stage, value) after each band and each fill iteration
+
+        Returns
+        -------
+        np.array
+            Label of each vertex, uint8 up to 255 labels, int32 otherwise
+        """
+        if progress is None :
+            progress = NoProgress
+        if labels is None :
+            labels = list(range(1,len(patches)+1))
+        if len(labels) != len(patches):
+            raise ValueError(f'{len(labels)} labels for {len(patches)} patches')
+        if min(labels,default=1) < 1 :
+            raise ValueError(f'The labels of the patches must be positive, got {list(labels)}')
+
+        arg_borders , arg_seeds = [], []
+        for patch in patches :
+            if isinstance(patch,ButterflyParameter):
+                landmark , curves = self.butterflyCurve(patch)
+                arg_borders.append(self.butterflyBand(curves))
+                arg_seeds.append(self.butterflySeed(landmark))
+            else :
+                outlinePoints , mid, *spline = patch
+                arg_borders.append(self.drawBand(outlinePoints,*spline))
+                arg_seeds.append(self.drawSeed(mid))
+            progress('band',len(arg_borders[-1]))
+
+        with TraceStage('fill',patches=len(patches),border=sum(len(arg) for arg in arg_borders),backend=self.backend.name) as stage:
+            V_label = np.zeros(len(self.vertices),dtype=np.uint8 if max(labels,default=0) < 256 else np.int32)
+            for arg_border, label in zip(arg_borders,labels):
+                V_label[arg_border] = label
+            V_label = self.backend.numpy(MultiDilation(arg_seeds,V_label,self.adjacency,labels=labels,progress=progress))
+            stage.set(labeled=int(np.count_nonzero(V_label)))
+        return V_label
+
+
+    def butterflyCurve(self,parameter : ButterflyParameter):
+        """
+        Return the landmarks and the Polyline of the Butterfly outline in the oriented frame
+        """
+        with TraceStage('landmarks'):
+            landmark = ButterflyLandmark(self.orientation.centroid(parameter.teeth()),parameter)
+            curves = ButterflyCurve(landmark)
+        return landmark, curves
+
+
+    def butterflyBand(self,curves):
+        index = self.index_oriented
+        start , end, _ = curves.segments()
+        with TraceStage('band',segments=len(start)) as stage:
+            arg_border = index.querySegment(start,end,self.radius)
+            stage.set(hits=len(arg_border))
+        return arg_border
+
+
+    def butterflySeed(self,landmark):
+        return np.argmin(np.sum(np.square(self.orientation.vertices[:,:2] - landmark['middle'][:2]),axis=1))
+
+
+    def drawCurve(self,outlinePoints,spline=False):
+        """
+        Return the Polyline of the closed outline, see computeDraw
+        """
+        curves = CurveBatch(dim=3)
+        if spline :
+            curves.spline(outlinePoints,self.radius_draw)
+        else :
+            curves.polygon(outlinePoints)
+        return curves.evaluate()
+
+
+    def drawBand(self,outlinePoints,spline=False):
+        index = self.index
+        start , end, _ = self.drawCurve(outlinePoints,spline).segments()
+        with TraceStage('band',segments=len(start)) as stage:
+            arg_outline = index.querySegment(start,end,self.radius_draw)
+            stage.set(hits=len(arg_outline))
+        return arg_outline
+
+
+    def drawSeed(self,mid):
+        return np.argmin(np.sum(np.square(self.vertices - np.array(mid,dtype=np.float32)),axis=1))
+
+
+    def apply(self,V_label,name='Butterfly'):
+        """
+        Add V_label to the point data of the surf, a uint8 V_label is stored as a vtkUnsignedCharArray
+        """
+        V_labels_prediction = numpy_to_vtk(V_label)
+        V_labels_prediction.SetName(name)
+        self.surf.GetPointData().AddArray(V_labels_prediction)
+
+
+    def update(self,parameter : ButterflyParameter,mode='fill',band=True,proxy=False,tolerance=None):
+        with TraceStage('butterflyPatch',vertices=len(self.vertices),mode=mode,proxy=proxy):
+            V_label = self.compute(parameter,mode=mode,band=band,proxy=proxy,tolerance=tolerance)
+            self.apply(V_label)
+        return V_label
+
+
+    def draw(self,outlinePoints,mid):
+        with TraceStage('drawPatch',vertices=len(self.vertices)):
+            V_label = self.computeDraw(outlinePoints,mid)
+            self.apply(V_label)
+        return V_label
+
+
+    def updatePatches(self,patches,labels=None,name='PatchLabel'):
+        """
+        Compute several patches in a single pass, see computePatches, and add their labels as the array name
+        """
+        with TraceStage('patches',vertices=len(self.vertices),patches=len(patches)):
+            V_label = self.computePatches(patches,labels=labels)
+            self.apply(V_label,name=name)
+        return V_label
@@ -0,0 +1,164 @@
+import numpy as np
+from Method.backend import toNumpy
+
+
+def RaggedRange(start,count):
+    """
+    Concatenation of the ranges [start[i], start[i]+count[i]) computed without python loop
+    """
+    shift = np.repeat(start - np.cumsum(count) + count,count)
+    return shift + np.arange(len(shift))
+
+
+
+class SpatialIndex:
+    """
+    Uniform grid hash over 2D or 3D points, build it once per mesh and reuse it for every radius query.
+    The points are sorted by cell, each occupied cell is a contiguous slice of self.order.
+
+    Parameters
+    ----------
+    points : np.array or torch.tensor
+        Points to index (nb_point, dim)
+    cell_size : float
+        Size of a cell, the queries are the cheapest when the radius is close to cell_size
+    """
+    def __init__(self,points,cell_size) -> None:
+        self.points = np.ascontiguousarray(toNumpy(points))
+        self.dim = self.points.shape[1]
+        self.cell_size = float(cell_size)
+
+        self.origin = self.points.min(axis=0).astype(np.float64)
+        cell = self.cell(self.points)
+        self.shape = cell.max(axis=0) + 1
+        self.stride = np.cumprod(np.concatenate([[1],self.shape[:-1]])).astype(np.int64)
+
+        key = cell @ self.stride
+        self.order = np.argsort(key,kind='stable')
+        self.cell_keys , self.cell_start, self.cell_count = np.unique(key[self.order],return_index=True,return_counts=True)
+
+    def cell(self,points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def segmentCandidates(self,start,end,radius):
+        """
+        Return the pairs (segment index, point index) of the points in the cells crossing the bounding box
+        of each segment grown by radius
+        """
+        low = np.maximum(self.cell(np.minimum(start,end) - radius),0)
+        high = np.minimum(self.cell(np.maximum(start,end) + radius),self.shape - 1)
+        size = np.maximum(high - low + 1,0)
+        number = np.prod(size,axis=1)
+
+        arg_segment = np.repeat(np.arange(len(start)),number)
+        local = RaggedRange(np.zeros(len(start),dtype=np.int64),number)
+        cell = np.empty((len(local),self.dim),dtype=np.int64)
+        for d in range(self.dim):
+            cell[:,d] = low[arg_segment,d] + local % size[arg_segment,d]
+            local = local // size[arg_segment,d]
+        key = cell @ self.stride
+
+        pos = np.searchsorted(self.cell_keys,key)
+        pos = np.minimum(pos,len(self.cell_keys)-1)
+        found = self.cell_keys[pos] == key
+        pos , arg_segment = pos[found], arg_segment[found]
+
+        count = self.cell_count[pos]
+        arg_point = self.order[RaggedRange(self.cell_start[pos],count)]
+        return np.repeat(arg_segment,count), arg_point
+
+    def querySegment(self,start,end,radius,chunk=4096):
+        """
+        Return the sorted indices of all the points at an exact distance lower than radius of at least
+        one segment [start, end]. Only the points in the bounding box of a segment are tested, long segments
+        are split in pieces of 2 cells so the boxes stay tight.
+
+        Parameters
+        ----------
+        start : np.array
+            First point of the segments (nb_segment, dim)
+        end : np.array
+            Last point of the segments (nb_segment, dim)
+        radius : float
+            Radius of the query
+
+        Returns
+        -------
+        np.array
+            Indices of the points (int64)
+        """
+        return np.unique(self.segmentPairs(start,end,radius,chunk)[1])
+
+    def segmentPairs(self,start,end,radius,chunk=4096):
+        """
+        Return the pairs (segment index, point index) of the points at an exact distance lower than radius
+        of the segment, a pair can appear several times. See querySegment.
+        """
+        start = toNumpy(start).reshape(-1,self.dim).astype(np.float64)
+        end = toNumpy(end).reshape(-1,self.dim).astype(np.float64)
+        arg_finite = np.flatnonzero(np.all(np.isfinite(start),axis=1) & np.all(np.isfinite(end),axis=1))
+        start , end = start[arg_finite], end[arg_finite]
+
+        piece = np.maximum(np.ceil(np.linalg.norm(end - start,axis=1) / (2 * self.cell_size)),1).astype(np.int64)
+        arg_segment = np.repeat(np.arange(len(start)),piece)
+        t = RaggedRange(np.zeros(len(start),dtype=np.int64),piece) / piece[arg_segment]
+        step = ((end - start) / piece[:,None])[arg_segment]
+        start = start[arg_segment] + t[:,None] * (end - start)[arg_segment]
+        end = start + step
+
+        out_segment , out_point = [np.zeros(0,dtype=np.int64)], [np.zeros(0,dtype=np.int64)]
+        for i in range(0,len(start),chunk):
+            arg_piece , arg_point = self.segmentCandidates(start[i:i+chunk],end[i:i+chunk],radius)
+            a , ab = start[i:i+chunk][arg_piece], step[i:i+chunk][arg_piece]
+            ap = self.points[arg_point] - a
+            length = np.einsum('ij,ij->i',ab,ab)
+            t = np.clip(np.einsum('ij,ij->i',ap,ab) / np.where(length > 0,length,1),0,1)
+            diff = ap - t[:,None] * ab
+            close = np.einsum('ij,ij->i',diff,diff) < radius * radius
+            out_segment.append(arg_finite[arg_segment[i + arg_piece[close]]])
+            out_point.append(arg_point[close])
+        return np.concatenate(out_segment), np.concatenate(out_point)
+
+
+
+def PointInPolygon(points,polygon,order=None,chunk=256):
+    """
+    Even-odd test of 2D points against a closed polygon, in one vectorized pass.
+    With the points sorted by y, each edge only meets the contiguous slice of points
+    in its y range, so the cost is the number of (edge, point) crossings candidates.
+
+    Parameters
+    ----------
+    points : np.array
+        Points (nb_point, 2)
+    polygon : np.array
+        Vertices of the polygon (nb_vertex, 2), the last one is linked to the first one
+    order : np.array, optional
+        np.argsort(points[:,1]), give it to reuse it between the calls
+
+    Returns
+    -------
+    np.array
+        True for the points inside the polygon
+    """
+    points = toNumpy(points)
+    polygon = toNumpy(polygon).astype(np.float64)
+    if order is None :
+        order = np.argsort(points[:,1],kind='stable')
+    y_sorted = points[order,1]
+
+    a , b = polygon, np.roll(polygon,-1,axis=0)
+    crossing = np.zeros(len(points),dtype=np.int64)
+    for i in range(0,len(a),chunk):
+        a_chunk , b_chunk = a[i:i+chunk], b[i:i+chunk]
+        low = np.searchsorted(y_sorted,np.minimum(a_chunk[:,1],b_chunk[:,1]))
+        high = np.searchsorted(y_sorted,np.maximum(a_chunk[:,1],b_chunk[:,1]))
+        count = high - low
+        arg_edge = np.repeat(np.arange(len(a_chunk)),count)
+        arg_point = order[RaggedRange(low,count)]
+
+        p , a_edge, b_edge = points[arg_point], a_chunk[arg_edge], b_chunk[arg_edge]
+        x_cross = a_edge[:,0] + (p[:,1] - a_edge[:,1]) * (b_edge[:,0] - a_edge[:,0]) / (b_edge[:,1] - a_edge[:,1])
+        crossing += np.bincount(arg_point[p[:,0] < x_cross],minlength=len(points))
+    return crossing % 2 == 1
+
@@ -0,0 +1,140 @@
+"""
+On-disk store of the patch labels. An entry is keyed by the content hash of the scan (PatchSession.mesh_hash)
+and by the canonical parameters of the computation, reopening a case reads its labels instead of recomputing them:
+
+    store = ResultStore()
+    V_label = store.compute(session, parameter)
+
+The entries use the file format of Method.cache. Binary labels are stored as a bit-packed mask or as the runs
+of consecutive labeled vertices, whichever is smaller, other labels as they are.
+"""
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+from Method.cache import WriteArrays, ReadArrays
+from Method.spatial import RaggedRange
+from Method.trace import TraceStage
+
+STORE_ENV = 'BUTTERFLY_STORE'
+# changed when the labels computed for the same parameters change, the entries of the other versions are not read
+STORE_VERSION = 1
+
+
+
+
+def ParameterKey(parameter,**options):
+    """
+    Return the hash of the canonical parameters: the fields of parameter as int (teeth) and float (ratios and
+    adjusts), the options of the computation (mode, band, radius, ...) and STORE_VERSION
+    """
+    canonical = {field : int(value) if field.startswith('tooth') else float(value) for field, value in parameter._asdict().items()}
+    canonical.update({name : float(value) if isinstance(value,float) else value for name, value in options.items()})
+    canonical['version'] = STORE_VERSION
+    return hashlib.sha256(json.dumps(canonical,sort_keys=True).encode()).hexdigest(), canonical
+
+
+def EncodeLabel(V_label):
+    """
+    Return the arrays and the encoding of V_label: 'packbits', 'runs' (start and length of the runs of labeled
+    vertices) or 'raw' when V_label is not binary
+    """
+    V_label = np.asarray(V_label)
+    if np.any(V_label > 1):
+        return {'label' : V_label}, 'raw'
+    arg = np.flatnonzero(V_label)
+    start = np.flatnonzero(np.diff(arg,prepend=-2) != 1)
+    runs = {'start' : arg[start].astype(np.int32), 'length' : np.diff(np.append(start,len(arg))).astype(np.int32)}
+    if 8 * len(start) < len(V_label) // 8 :
+        return runs, 'runs'
+    return {'mask' : np.packbits(V_label.astype(bool))}, 'packbits'
+
+
+def DecodeLabel(arrays,encoding,size):
+    if encoding == 'raw':
+        return np.array(arrays['label'])
+    if encoding == 'packbits':
+        return np.unpackbits(arrays['mask'],count=size)
+    V_label = np.zeros(size,dtype=np.uint8)
+    V_label[RaggedRange(np.asarray(arrays['start'],dtype=np.int64),np.asarray(arrays['length'],dtype=np.int64))] = 1
+    return V_label
+
+
+
+
+class ResultStore:
+    """
+    Directory of the patch labels, one folder per scan content hash and one file per parameters.
+    The keys of a scan are listed once, then a lookup is a dictionary hit and a memory-mapped read.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Folder of the store, the BUTTERFLY_STORE environment variable or ~/.cache/butterfly/results by default
+    """
+    def __init__(self,directory=None) -> None:
+        if directory is None:
+            directory = os.environ.get(STORE_ENV,os.path.join(os.path.expanduser('~'),'.cache','butterfly','results'))
+        self.directory = directory
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def folder(self,mesh_hash):
+        return os.path.join(self.directory,mesh_hash[:2],mesh_hash)
+
+    def keys(self,mesh_hash):
+        with self._lock:
+            if mesh_hash not in self.entries:
+                folder = self.folder(mesh_hash)
+                names = os.listdir(folder) if os.path.isdir(folder) else []
+                self.entries[mesh_hash] = {os.path.splitext(name)[0] for name in names if name.endswith('.bfly')}
+            return self.entries[mesh_hash]
+
+    def get(self,mesh_hash,key):
+        """
+        Return the labels stored for the scan mesh_hash and the parameters key, None if there is none
+        """
+        if key not in self.keys(mesh_hash):
+            return None
+        with TraceStage('store_read'):
+            info , arrays = ReadArrays(os.path.join(self.folder(mesh_hash),key + '.bfly'),mode='r')
+            return DecodeLabel(arrays,info['encoding'],info['size'])
+
+    def put(self,mesh_hash,key,V_label,parameter=None):
+        with TraceStage('store_write'):
+            arrays , encoding = EncodeLabel(V_label)
+            WriteArrays(os.path.join(self.folder(mesh_hash),key + '.bfly'),arrays,
+                        info={'encoding' : encoding,'size' : len(V_label),'parameter' : parameter})
+        keys = self.keys(mesh_hash)
+        with self._lock:
+            keys.add(key)
+
+    def compute(self,session,parameter,mode='fill',band=True,progress=None,proxy=False,tolerance=None):
+        """
+        Return the labels of PatchSession.compute, read from the store when they were already computed
+        for the same scan and parameters, otherwise computed and stored
+        """
+        options = dict(mode=mode,band=band,radius=session.radius)
+        if proxy :
+            options.update(proxy=session.proxy_size,tolerance=tolerance)
+        key , canonical = ParameterKey(parameter,**options)
+        V_label = self.get(session.mesh_hash,key)
+        if V_label is None :
+            V_label = session.compute(parameter,mode=mode,band=band,progress=progress,proxy=proxy,tolerance=tolerance)
+            self.put(session.mesh_hash,key,V_label,canonical)
+        return V_label
+
+
+_store = None
+
+
+def GetStore():
+    """
+    Return the ResultStore of the default directory, shared by the callers
+    """
+    global _store
+    if _store is None:
+        _store = ResultStore()
+    return _store
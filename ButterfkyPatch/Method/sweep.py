@@ -0,0 +1,184 @@
+"""
+Evaluate many Butterfly parameters on one scan, for example to calibrate the ratios and adjusts:
+
+    sweep = ParameterSweep(PatchSession(surf))
+    summary = sweep.summary(parameters)      # parameters (N, 12) in the order of ButterflyParameter
+
+The landmarks of the N outlines are computed as stacked arrays and their curves are evaluated in one batch
+(see Method.curve), the orientation and
+the spatial index of the session are built once. The labels are the ones of PatchSession.compute with
+mode='inside' and band=True.
+"""
+import numpy as np
+
+from Method.make_butterfly import ButterflyParameter, ButterflyCurve, ButterflyPolygon
+from Method.spatial import RaggedRange
+from Method.trace import TraceStage
+
+
+
+
+def ParameterArray(parameters):
+    """
+    Return the parameters as a float64 array (N, 12), parameters is an array or a list of ButterflyParameter
+    """
+    parameters = np.array(parameters,dtype=np.float64).reshape(-1,len(ButterflyParameter._fields))
+    return parameters
+
+
+def SweepLandmark(centroid,parameters):
+    """
+    Batched ButterflyLandmark, each landmark is an array (N, 3). The operations and dtypes are the ones of
+    ButterflyLandmark so the landmarks are the same.
+
+    Parameters
+    ----------
+    centroid : dict
+        Oriented centroid of every tooth used by parameters, as returned by Orientation.centroid
+    parameters : np.array
+        Parameters (N, 12)
+    """
+    teeth = parameters[:,:4].astype(np.int64)
+    ratio = parameters[:,4:8]
+    adjust = parameters[:,8:12]
+
+    def Centroid(column,adjust):
+        offset = np.zeros((len(parameters),3),dtype=np.float32)
+        offset[:,1] = adjust
+        return np.stack([centroid[str(tooth)] for tooth in teeth[:,column]]) + offset
+
+    def Mix(ratio,point1,point2):
+        return (1 - ratio).astype(np.float32)[:,None] * point1 + ratio.astype(np.float32)[:,None] * point2
+
+    anterior_right = Centroid(0,adjust[:,0])
+    anterior_left = Centroid(1,adjust[:,1])
+    posterior_right = Centroid(2,adjust[:,2])
+    posterior_left = Centroid(3,adjust[:,3])
+
+    landmark = {}
+    landmark['anterior_left'] = Mix(ratio[:,1],anterior_right,anterior_left)
+    landmark['anterior_right'] = Mix(ratio[:,0],anterior_left,anterior_right)
+    landmark['posterior_left'] = Mix(ratio[:,2],posterior_right,posterior_left)
+    landmark['posterior_right'] = Mix(ratio[:,3],posterior_left,posterior_right)
+    landmark['middle_posterior'] = (landmark['posterior_left'] + landmark['posterior_right']) / 2
+    landmark['middle'] = (landmark['posterior_left'] + landmark['anterior_right']) / 2
+    return landmark
+
+
+def VertexArea(vertices,faces):
+    """
+    Area of the mesh around each vertex, a third of the area of its faces
+    """
+    vertices = np.asarray(vertices,dtype=np.float64)
+    a , b, c = vertices[faces[:,0]], vertices[faces[:,1]], vertices[faces[:,2]]
+    area = np.linalg.norm(np.cross(b - a,c - a),axis=1) / 6
+    return np.bincount(faces.reshape(-1),weights=np.repeat(area,3),minlength=len(vertices))
+
+
+
+
+class ParameterSweep:
+    """
+    Labels of N Butterfly outlines on the scan of a session, computed by chunks of configurations.
+    For each chunk, the band is the exact distance to all the stacked segments, and the inside test only
+    visits the vertices in the cells of the bounding box of each polygon: the edges crossing the horizontal
+    of a vertex are found by the rank of the vertex along y.
+
+    Parameters
+    ----------
+    session : PatchSession
+        Session of the scan, its orientation and oriented spatial index are reused
+    """
+    def __init__(self,session) -> None:
+        self.session = session
+        self.points = session.orientation.vertices[:,:2]
+        self.index = session.index_oriented
+        order = session.order_y
+        self.y_sorted = self.points[order,1]
+        self.rank = np.empty(len(order),dtype=np.int64)
+        self.rank[order] = np.arange(len(order))
+
+    def outline(self,parameters):
+        """
+        Return the Polyline of the curves (see ButterflyCurve) and the polygons (see ButterflyPolygon) of parameters,
+        raise ToothNoExist if a tooth of parameters is missing
+        """
+        parameters = ParameterArray(parameters)
+        with TraceStage('sweep_curve',configurations=len(parameters)):
+            teeth = np.unique(parameters[:,:4].astype(np.int64))
+            curves = ButterflyCurve(SweepLandmark(self.session.orientation.centroid(teeth),parameters))
+            return curves, ButterflyPolygon(curves)
+
+    def pairs(self,curves,polygon):
+        """
+        Return the pairs (configuration, vertex) of the labeled vertices of the outlines, without duplicate
+        """
+        number = len(self.points)
+        with TraceStage('sweep_band') as stage:
+            # the curves are the N anterior segments, the N posterior segments, ...
+            start , end, arg_curve = curves.segments()
+            arg_segment , arg_band = self.index.segmentPairs(start,end,self.session.radius)
+            band = arg_curve[arg_segment] % len(polygon) * number + arg_band
+            stage.set(hits=len(band))
+
+        with TraceStage('sweep_inside') as stage:
+            # vertices in the cells of the bounding box of each polygon, sorted by configuration then y
+            arg_config , arg_point = self.index.segmentCandidates(polygon.min(axis=1),polygon.max(axis=1),0)
+            key = arg_config * number + self.rank[arg_point]
+            order = np.argsort(key,kind='stable')
+            key , arg_config, arg_point = key[order], arg_config[order], arg_point[order]
+
+            a = polygon.reshape(-1,2)
+            b = np.roll(polygon,-1,axis=1).reshape(-1,2)
+            edge_config = np.repeat(np.arange(len(polygon)),polygon.shape[1]) * number
+            low = np.searchsorted(key,edge_config + np.searchsorted(self.y_sorted,np.minimum(a[:,1],b[:,1])))
+            high = np.searchsorted(key,edge_config + np.searchsorted(self.y_sorted,np.maximum(a[:,1],b[:,1])))
+            count = high - low
+            arg_edge = np.repeat(np.arange(len(a)),count)
+            arg_pair = RaggedRange(low,count)
+
+            p , a_edge, b_edge = self.points[arg_point[arg_pair]], a[arg_edge], b[arg_edge]
+            x_cross = a_edge[:,0] + (p[:,1] - a_edge[:,1]) * (b_edge[:,0] - a_edge[:,0]) / (b_edge[:,1] - a_edge[:,1])
+            crossing = np.bincount(arg_pair[p[:,0] < x_cross],minlength=len(key))
+            inside = crossing % 2 == 1
+            inside = arg_config[inside] * number + arg_point[inside]
+            stage.set(candidates=len(key),crossings=len(arg_pair))
+
+        # a flat mask removes the duplicates without sorting the band pairs
+        mask = np.zeros(len(polygon) * number,dtype=bool)
+        mask[band] = True
+        mask[inside] = True
+        pair = np.flatnonzero(mask)
+        return pair // number, pair % number
+
+    def labels(self,parameters,chunk=64):
+        """
+        Return the label matrix (N, V) uint8 of parameters, the parameters (N, 12) are processed by chunk
+        configurations to bound the memory
+        """
+        parameters = ParameterArray(parameters)
+        V_label = np.zeros((len(parameters),len(self.points)),dtype=np.uint8)
+        for i in range(0,len(parameters),chunk):
+            arg_config , arg_point = self.pairs(*self.outline(parameters[i:i+chunk]))
+            V_label[i + arg_config,arg_point] = 1
+        return V_label
+
+    def summary(self,parameters,chunk=64):
+        """
+        Return, for each configuration, the number of labeled vertices ('count'), the mesh area around them
+        ('area', see VertexArea) and the area of the outline polygon in the oriented plane ('outline_area')
+        """
+        parameters = ParameterArray(parameters)
+        if not hasattr(self,'vertex_area'):
+            self.vertex_area = VertexArea(self.session.vertices,self.session.faces)
+        count = np.zeros(len(parameters),dtype=np.int64)
+        area = np.zeros(len(parameters),dtype=np.float64)
+        outline_area = np.zeros(len(parameters),dtype=np.float64)
+        for i in range(0,len(parameters),chunk):
+            curves , polygon = self.outline(parameters[i:i+chunk])
+            arg_config , arg_point = self.pairs(curves,polygon)
+            count[i:i+chunk] = np.bincount(arg_config,minlength=len(polygon))
+            area[i:i+chunk] = np.bincount(arg_config,weights=self.vertex_area[arg_point],minlength=len(polygon))
+            x , y = polygon[:,:,0], polygon[:,:,1]
+            outline_area[i:i+chunk] = np.abs(np.sum(x * np.roll(y,-1,axis=1) - np.roll(x,-1,axis=1) * y,axis=1)) / 2
+        return {'count' : count, 'area' : area, 'outline_area' : outline_area}
@@ -0,0 +1,90 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_pool = None
+POOL_SIZE = min(4,os.cpu_count() or 1)
+
+
+def GetExecutor():
+    """
+    Return the executor shared by the tasks when none is given, it runs one task at a time
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1,thread_name_prefix='PatchTask')
+    return _executor
+
+
+def GetPool():
+    """
+    Return the bounded thread pool shared by the tasks run together, for example one per scan
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=POOL_SIZE,thread_name_prefix='PatchPool')
+    return _pool
+
+
+
+class PatchCancelled(Exception):
+    def __init__(self) -> None:
+        self.message = 'The computation of the patch was cancelled'
+        super().__init__(self.message)
+
+    def __str__(self) -> str:
+        return self.message
+
+
+
+class PatchTask:
+    """
+    Run function(progress) in a background thread. function calls progress(stage, value) between its steps,
+    the messages are queued for the caller, and progress raises PatchCancelled once cancel() is called.
+    The result is only read by the caller, for example on the Qt main thread with a timer.
+
+    Parameters
+    ----------
+    function : callable
+        Computation taking the progress callback, for example lambda progress : session.compute(parameter, progress=progress)
+    executor : concurrent.futures.Executor, optional
+        Thread pool running the task, GetExecutor() by default
+    """
+    def __init__(self,function,executor=None) -> None:
+        self._cancel = threading.Event()
+        self._messages = queue.SimpleQueue()
+        self.future = (executor or GetExecutor()).submit(function,self.progress)
+
+    def progress(self,stage,value=None):
+        if self._cancel.is_set():
+            raise PatchCancelled()
+        self._messages.put((stage,value))
+
+    def messages(self):
+        """
+        Return the (stage, value) reported since the last call
+        """
+        out = []
+        while not self._messages.empty():
+            out.append(self._messages.get())
+        return out
+
+    def cancel(self):
+        self._cancel.set()
+        self.future.cancel()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """
+        Return the result of function, raise its exception or PatchCancelled
+        """
+        if self.future.cancelled():
+            raise PatchCancelled()
+        return self.future.result()
@@ -0,0 +1,144 @@
+"""
+Opt-in instrumentation of the Butterfly pipeline. Nothing is recorded outside of a Tracer:
+
+    with Tracer() as tracer:
+        PatchSession(surf).update(parameter)
+    tracer.writeTrace('patch.trace.json')
+
+TraceStage and TraceCount only check a global when no Tracer is active.
+"""
+import json
+import time
+import threading
+
+_tracer = None
+
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        return False
+
+    def set(self,**info):
+        pass
+
+_null_stage = _NullStage()
+
+
+
+class _Stage:
+    def __init__(self,tracer,name,info) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self,*args):
+        end = time.perf_counter()
+        self.tracer.add(dict(name=self.name,type='stage',start=self.start - self.tracer.origin,duration=end - self.start,
+                             thread=threading.get_ident(),**self.info))
+        return False
+
+    def set(self,**info):
+        """
+        Add information to the record of the stage, for example the size of its result
+        """
+        self.info.update(info)
+
+
+
+class Tracer:
+    """
+    Collect the records of the stages (wall time, sizes) and of the counters (for example the frontier
+    sizes of Dilation) run inside the with block, in every thread.
+
+    Parameters
+    ----------
+    logger : logging.Logger, optional
+        Each record is also logged as a json string on this logger
+    """
+    def __init__(self,logger=None) -> None:
+        self.records = []
+        self.logger = logger
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _tracer
+        self.previous = _tracer
+        _tracer = self
+        return self
+
+    def __exit__(self,*args):
+        global _tracer
+        _tracer = self.previous
+        return False
+
+    def add(self,record):
+        with self._lock:
+            self.records.append(record)
+        if self.logger is not None:
+            self.logger.info(json.dumps(record))
+
+    def summary(self):
+        """
+        Return the total wall time of each stage name
+        """
+        total = {}
+        for record in self.records:
+            if record['type'] == 'stage':
+                total[record['name']] = total.get(record['name'],0) + record['duration']
+        return total
+
+    def writeRecords(self,path):
+        """
+        Write the records as json lines
+        """
+        with open(path,'w') as file:
+            for record in self.records:
+                file.write(json.dumps(record) + '\n')
+
+    def writeTrace(self,path):
+        """
+        Write the records in the trace event format, it opens in chrome://tracing or Perfetto
+        """
+        events = []
+        for record in self.records:
+            args = {key : value for key, value in record.items() if key not in ('name','type','start','duration','thread')}
+            event = {'name' : record['name'], 'pid' : 0, 'tid' : record['thread'], 'ts' : record['start'] * 1e6, 'args' : args}
+            if record['type'] == 'stage':
+                event.update(ph='X',dur=record['duration'] * 1e6)
+            else :
+                event.update(ph='i',s='t')
+            events.append(event)
+        with open(path,'w') as file:
+            json.dump({'traceEvents' : events},file)
+
+
+
+def IsTracing():
+    return _tracer is not None
+
+
+def TraceStage(name,**info):
+    """
+    Context manager recording the wall time of the block and info, a no-op without Tracer
+    """
+    if _tracer is None:
+        return _null_stage
+    return _Stage(_tracer,name,info)
+
+
+def TraceCount(name,**values):
+    """
+    Record values (counts, sizes) without timing, a no-op without Tracer
+    """
+    if _tracer is None:
+        return
+    _tracer.add(dict(name=name,type='count',start=time.perf_counter() - _tracer.origin,thread=threading.get_ident(),**values))
@@ -1,5 +1,6 @@
 import numpy as np
-import vtk
+from vtkmodules.vtkCommonDataModel import vtkPolyData
+from vtkmodules.vtkCommonTransforms import vtkTransform
 def RotationMatrix(axis, theta):
     """
     Return the rotation matrix associated with counterclockwise rotation about
@@ -33,13 +34,42 @@ def RotationMatrix(axis, theta):
 
 
 
+def TransformPoints(points,matrix,out=None,chunk=65536):
+    """
+    Apply the 4x4 matrix to points without copying the mesh.
+
+    Parameters
+    ----------
+    points : np.array
+        Points (nb_point, 3), for example a view of the vtkPoints of a surf, it is not modified
+    matrix : np.array
+        4x4 matrix
+    out : np.array, optional
+        Preallocated buffer (nb_point, 3) of the result, float32 when None
+    chunk : int
+        Number of points transformed at once in double precision, bounds the temporary memory
+
+    Returns
+    -------
+    np.array
+        out
+    """
+    matrix = np.asarray(matrix,dtype=np.float64)
+    if out is None :
+        out = np.empty(points.shape,dtype=np.float32)
+    for i in range(0,len(points),chunk):
+        out[i:i+chunk] = points[i:i+chunk] @ matrix[:3,:3].T + matrix[:3,3]
+    return out
+
+
+
 def TransformSurf(surf,matrix):
-    assert isinstance(surf,vtk.vtkPolyData)
-    surf_copy = vtk.vtkPolyData()
-    surf_copy.DeepCopy(surf)
-    surf = surf_copy
+    """
+    Return a transformed copy of surf, vtkTransformPolyDataFilter does not modify surf
+    """
+    assert isinstance(surf,vtkPolyData)
 
-    transform = vtk.vtkTransform()
+    transform = vtkTransform()
     transform.SetMatrix(np.reshape(matrix,16))
     surf = RotateTransform(surf,transform)
 
@@ -47,8 +77,9 @@ def TransformSurf(surf,matrix):
 
 
 def RotateTransform(surf, transform):
+    from vtkmodules.vtkFiltersGeneral import vtkTransformPolyDataFilter
 
-    transformFilter = vtk.vtkTransformPolyDataFilter()
+    transformFilter = vtkTransformPolyDataFilter()
     transformFilter.SetTransform(transform)
     transformFilter.SetInputData(surf)
     transformFilter.Update()
@@ -1,6 +1,12 @@
+import os
+import hashlib
+import threading
 import numpy as np
-from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
-import vtk
+from collections import OrderedDict
+# the vtk modules are imported one by one, import vtk loads all of them
+from vtkmodules.util.numpy_support import vtk_to_numpy, numpy_to_vtk, numpy_to_vtkIdTypeArray
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkPolyData, vtkCellArray
 
 class vtkTeeth:
     def __init__(self,list_teeth,property =None):
@@ -38,15 +44,144 @@ class vtkTeeth:
         return out
 
 
+    def GetToothIndex(self,surf):
+        self.CheckLabelSurface(surf,self.property)
+        if not self.isLabelSurface(surf,self.property):
+            raise NoSegmentationSurf(self.property)
+        return GetToothIndex(surf,self.property)
+
+
+
+
+class ToothIndex:
+    """
+    Vertices grouped by label with a single stable argsort of the label array,
+    the vertices of the tooth labels[i] are order[start[i]:start[i]+count[i]].
+    The mean, the middle of the bounding box and the number of vertices of every
+    tooth are computed in the same pass.
+
+    Parameters
+    ----------
+    region_id : np.array
+        Label of each vertex
+    verts : np.array
+        Vertices (nb_vertex, 3)
+    """
+    def __init__(self,region_id,verts) -> None:
+        region_id = np.asarray(region_id).reshape(len(verts),-1)[:,0]
+        self.order = np.argsort(region_id,kind='stable')
+        self.labels , self.start, self.count = np.unique(region_id[self.order],return_index=True,return_counts=True)
+
+        sorted_verts = verts[self.order]
+        self.means = (np.add.reduceat(sorted_verts,self.start,axis=0,dtype=np.float64) / self.count[:,None]).astype(verts.dtype)
+        self.middles = (np.maximum.reduceat(sorted_verts,self.start,axis=0) + np.minimum.reduceat(sorted_verts,self.start,axis=0)) / 2
+
+    arrays = ['order','labels','start','count','means','middles']
+
+    @classmethod
+    def fromArrays(cls,arrays):
+        """
+        Rebuild a ToothIndex from the dict of its arrays, for example read from Method.cache
+        """
+        index = cls.__new__(cls)
+        for name in cls.arrays:
+            setattr(index,name,arrays[name])
+        return index
+
+    def position(self,tooth):
+        pos = np.searchsorted(self.labels,tooth)
+        if pos == len(self.labels) or self.labels[pos] != tooth:
+            raise ToothNoExist(tooth)
+        return pos
+
+    def vertices(self,tooth):
+        """
+        Return the indices of the vertices of tooth, raise ToothNoExist if there is none
+        """
+        pos = self.position(tooth)
+        return self.order[self.start[pos]:self.start[pos]+self.count[pos]]
+
+    def mean(self,list_teeth):
+        return self.means[[self.position(tooth) for tooth in list_teeth]]
+
+    def middle(self,list_teeth):
+        return self.middles[[self.position(tooth) for tooth in list_teeth]]
+
+    def number(self,list_teeth):
+        return self.count[[self.position(tooth) for tooth in list_teeth]]
+
+
+
+
+_tooth_index_cache = OrderedDict()
+_tooth_index_lock = threading.Lock()
+TOOTH_INDEX_CACHE_SIZE = 8
+
+
+def LabelProperty(surf,property='Universal_ID'):
+    """
+    Return the name of the teeth label array of surf: property when surf has it, otherwise the array chosen
+    by vtkTeeth.GetLabelSurface, property when surf has no point array
+    """
+    teeth = vtkTeeth(None,property)
+    teeth.CheckLabelSurface(surf,property)
+    return teeth.property if teeth.property is not None else property
+
+
+def MeshKey(surf,property):
+    """
+    Key of the geometry and of the label array of surf, it changes when one of them is modified
+    """
+    labels = surf.GetPointData().GetScalars(property)
+    if labels is None :
+        raise NoSegmentationSurf(property)
+    return (id(surf),surf.GetNumberOfPoints(),surf.GetPoints().GetMTime(),labels.GetMTime())
+
+
+def ContentHash(*arrays):
+    """
+    sha256 of the dtype, shape and content of the arrays, the key of a mesh independent of its file
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(memoryview(array).cast('B'))
+    return digest.hexdigest()
+
+
+def GetToothIndex(surf,property='Universal_ID'):
+    """
+    Return the ToothIndex of surf, it is built once and reused until the points or the labels are modified
+    """
+    key = MeshKey(surf,property) + (property,)
+    with _tooth_index_lock:
+        if key in _tooth_index_cache:
+            _tooth_index_cache.move_to_end(key)
+            return _tooth_index_cache[key]
+
+    index = ToothIndex(vtk_to_numpy(surf.GetPointData().GetScalars(property)),vtk_to_numpy(surf.GetPoints().GetData()))
+    SetToothIndex(surf,index,property)
+    return index
+
+
+def SetToothIndex(surf,index,property='Universal_ID'):
+    """
+    Give the ToothIndex of surf when it is already known, for example read from Method.cache
+    """
+    key = MeshKey(surf,property) + (property,)
+    with _tooth_index_lock:
+        _tooth_index_cache[key] = index
+        if len(_tooth_index_cache) > TOOTH_INDEX_CACHE_SIZE:
+            _tooth_index_cache.popitem(last=False)
+
+
 
 
 class vtkIterTeeth(vtkTeeth):
     def __init__(self, list_teeth, surf, property=None):
         super().__init__(list_teeth, property)
-        self.CheckLabelSurface(surf,property)
-        if not self.isLabelSurface(surf,self.property):
-            raise NoSegmentationSurf(self.property)
-        self.region_id = vtk_to_numpy(surf.GetPointData().GetScalars(self.property))
+        self.index = self.GetToothIndex(surf)
         self.verts = vtk_to_numpy(surf.GetPoints().GetData())
 
     def __iter__(self):
@@ -57,9 +192,7 @@ class vtkIterTeeth(vtkTeeth):
         if self.iter >= len(self.list_teeth):
             raise StopIteration
         
-        verts_crown = np.argwhere(self.region_id==self.list_teeth[self.iter])
-        if len(verts_crown)== 0 :
-            raise ToothNoExist(self.list_teeth[self.iter])
+        verts_crown = self.index.vertices(self.list_teeth[self.iter])[:,None]
 
         self.iter += 1 
         return np.array(self.verts[verts_crown]) , self.list_teeth[self.iter-1]
@@ -71,10 +204,8 @@ class vtkMeanTeeth(vtkTeeth):
         super().__init__(list_teeth, property)
 
     def __call__(self, surf) :
-        dic ={}
-        for points, tooth in vtkIterTeeth(self.list_teeth,surf,property=self.property):
-            dic[str(tooth)]= np.array(np.mean(points,0).squeeze(0))
-        return dic
+        index = self.GetToothIndex(surf)
+        return {str(tooth) : mean for tooth, mean in zip(self.list_teeth,index.mean(self.list_teeth))}
 
 
 class vtkMiddleTeeth(vtkTeeth):
@@ -82,43 +213,35 @@ class vtkMiddleTeeth(vtkTeeth):
         super().__init__(list_teeth, property)
 
     def __call__(self,surf):
-        dic ={} 
-        for points, tooth in vtkIterTeeth(self.list_teeth,surf,property=self.property):
-            dic[str(tooth)]= ((np.amax(points,axis=0)+np.amin(points,axis = 0))/2).squeeze(0)
-        return dic
+        index = self.GetToothIndex(surf)
+        return {str(tooth) : middle for tooth, middle in zip(self.list_teeth,index.middle(self.list_teeth))}
 
 
 class vtkMeshTeeth(vtkTeeth):
+    """
+    Point cloud of the vertices of the teeth (every label except the lowest and the highest, the gum),
+    with one vertex cell per point and a numeric 'labels' array numbering the points
+    """
     def __init__(self, list_teeth=None, property=None):
         super().__init__(list_teeth, property)
     def __call__(self,surf):
-        self.CheckLabelSurface(surf,self.property)
-        region_id = vtk_to_numpy(surf.GetPointData().GetScalars(self.property))
-        list_teeth = np.unique(region_id)[1:-1]
-        list_points = []
-        size = 0
-
-        for points, _ in  vtkIterTeeth(list_teeth,surf,property=self.property):
-            list_points.append(points)
-            size+= points.shape[0]
-
-    
-
-        Points = vtk.vtkPoints()
-        Vertices = vtk.vtkCellArray()
-        labels = vtk.vtkStringArray()
-        labels.SetNumberOfValues(size)
+        index = self.GetToothIndex(surf)
+        # the teeth labels[1:-1] are a contiguous slice of the vertices sorted by label
+        if len(index.labels) > 2 :
+            arg_teeth = index.order[index.start[1]:index.start[-1]]
+        else :
+            arg_teeth = np.zeros(0,dtype=np.int64)
+        size = len(arg_teeth)
+
+        Points = vtkPoints()
+        Points.SetData(numpy_to_vtk(np.asarray(vtk_to_numpy(surf.GetPoints().GetData())[arg_teeth],dtype=np.float32),deep=True))
+        Vertices = vtkCellArray()
+        Vertices.SetData(numpy_to_vtkIdTypeArray(np.arange(size + 1,dtype=np.int64),deep=True),
+                         numpy_to_vtkIdTypeArray(np.arange(size,dtype=np.int64),deep=True))
+        labels = numpy_to_vtk(np.arange(size,dtype=np.int32),deep=True)
         labels.SetName("labels")
-        index = 0 
-        for  points in list_points:
-            for i in range(points.shape[0]):
-                sp_id = Points.InsertNextPoint(points[i,:].squeeze(0))
-                Vertices.InsertNextCell(1)
-                Vertices.InsertCellPoint(sp_id)
-                labels.SetValue(index, str(index))
-                index+=1
-            
-        output = vtk.vtkPolyData()
+
+        output = vtkPolyData()
         output.SetPoints(Points)
         output.SetVerts(Vertices)
         output.GetPointData().AddArray(labels)
@@ -155,11 +278,50 @@ class NoSegmentationSurf(Exception):
 
 
 def ComputeNormals(surf):
-    normals = vtk.vtkPolyDataNormals()
+    from vtkmodules.vtkFiltersCore import vtkPolyDataNormals
+
+    normals = vtkPolyDataNormals()
     normals.SetInputData(surf)
     normals.ComputeCellNormalsOff()
     normals.ComputePointNormalsOn()
     normals.SplittingOff()
     normals.Update()
 
-    return normals.GetOutput()
\ No newline at end of file
+    return normals.GetOutput()
+
+
+
+def ReadSurf(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.vtk':
+        from vtkmodules.vtkIOLegacy import vtkPolyDataReader
+        reader = vtkPolyDataReader()
+    elif extension == '.vtp':
+        from vtkmodules.vtkIOXML import vtkXMLPolyDataReader
+        reader = vtkXMLPolyDataReader()
+    elif extension == '.stl':
+        from vtkmodules.vtkIOGeometry import vtkSTLReader
+        reader = vtkSTLReader()
+    else :
+        raise ValueError(f'Unknown surface format {extension}, use .vtk, .vtp or .stl')
+    reader.SetFileName(path)
+    reader.Update()
+    surf = reader.GetOutput()
+    if surf is None or surf.GetNumberOfPoints() == 0 :
+        raise ValueError(f'No surface could be read from {path}')
+    return surf
+
+
+def WriteSurf(surf,path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.vtk':
+        from vtkmodules.vtkIOLegacy import vtkPolyDataWriter
+        writer = vtkPolyDataWriter()
+    elif extension == '.vtp':
+        from vtkmodules.vtkIOXML import vtkXMLPolyDataWriter
+        writer = vtkXMLPolyDataWriter()
+    else :
+        raise ValueError(f'Unknown surface format {extension}, use .vtk or .vtp')
+    writer.SetFileName(path)
+    writer.SetInputData(surf)
+    writer.Update()
\ No newline at end of file